@@ -1,8 +1,10 @@
 # app.py — versión con multiselector de empresas + título dinámico según ítems (1ra palabra, orden de selección)
 
-import os, sys, io, re
+import os, sys, io
+from functools import partial
 import streamlit as st
 import pandas as pd
+import numpy as np
 import altair as alt
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -10,39 +12,213 @@ if BASE_DIR not in sys.path:
     sys.path.insert(0, BASE_DIR)
 
 from utils import (
-    prepare_dataframe, items_display_list,
-    build_daily_table_all_range, build_numeric_pivot_range
+    memory_report,
+    build_item_catalog, catalog_date_bounds, item_options, resolve_item_ids, table_title,
+    build_daily_cube, cube_pivot_measures, build_daily_table_from_pivot, format_table_display, MEASURE_LABELS,
+    CHART_RESOLUTIONS, choose_resolution, rollup_pivot,
+    build_cumulative, COMPARISON_MODES, comparison_range, cum_daily_totals, cum_window_totals, add_comparison,
+    top_items, RANKING_ALL, EMPRESA_LABELS
 )
+from disk_cache import content_hash
+from ingest import load_dataset, prepared_paths
+from daily_store import STORE_DIR, load_manifest, append_prepared, read_daily, store_catalog, store_pivot_measures
+from query_engine import DEFAULT_ENGINE, open_engine
+from excel_export import export_table_excel
+from dataset_registry import DatasetRegistry
+from background import make_pool, Precomputed
+from instrumentation import start_run, discard_run, stage, finish_run, timed_event, stages_frame
 
 st.set_page_config(page_title="Ventas x Ítem — Tabla y Gráficas", layout="wide")
 st.title("📊 Ventas por Ítem(s) x Sedes")
 st.caption("Rango de fechas, filtro por empresas, todas las sedes por empresa, guiones en lugar de 0, totales resaltados, domingos en rojo y varias gráficas.")
 
+# ====== Diagnóstico (tiempos y memoria por etapa) ======
+# El checkbox se dibuja al final del sidebar; su valor del rerun anterior decide si se mide este.
+DIAG_DEFAULT = os.environ.get("VENTAS_METRICS", "0") == "1"
+diag_on = st.session_state.get("diag_on", DIAG_DEFAULT)
+# start_run reemplaza y discard_run suelta la medición que un rerun cortado haya dejado activa en el hilo
+if diag_on:
+    start_run()
+else:
+    discard_run()
+
+def _finish():
+    # Cierra la medición del rerun (log JSON lines) y dibuja el panel
+    run = finish_run() if diag_on else None
+    st.sidebar.checkbox("Diagnóstico de rendimiento", value=DIAG_DEFAULT, key="diag_on",
+                        help="Mide tiempo, filas y memoria de cada etapa y los guarda en el log local.")
+    if run:
+        with st.sidebar.expander("Etapas del último rerun", expanded=True):
+            mem = [f"RSS máx. del rerun (por etapa): {run['rerun_rss_max_mb']:,.0f} MB "
+                   f"({run['rerun_rss_delta_mb']:+,.0f} MB)"] if run["rerun_rss_max_mb"] is not None else []
+            if run["max_rss_mb"] is not None:
+                mem.append(f"pico del proceso desde el arranque: {run['max_rss_mb']:,.0f} MB")
+            st.caption(" · ".join([f"Total: {run['total_ms']:,.0f} ms"] + mem))
+            st.dataframe(stages_frame(run), use_container_width=True, hide_index=True)
+
+def _stop():
+    _finish()
+    st.stop()
+
+
+uploaded_files = st.file_uploader(
+    "📥 Cargar CSV", type=["csv"], accept_multiple_files=True,
+    help="Puedes subir varios archivos (p. ej. uno por mes y empresa); se unen sin duplicar días."
+)
+# ====== Almacén local incremental (Parquet por mes) ======
+store_version = load_manifest(STORE_DIR)["version"]
+st.sidebar.subheader("Almacén local")
+usar_almacen = st.sidebar.checkbox(
+    "Consultar desde el almacén", value=False, disabled=store_version == 0,
+    help="Usa los días acumulados en el almacén local en lugar de los archivos subidos."
+)
+if usar_almacen:
+    st.sidebar.caption(f"Motor de consulta: {DEFAULT_ENGINE} (VENTAS_ENGINE)")
 
-uploaded = st.file_uploader("📥 Cargar CSV", type=["csv"])
-if uploaded is None:
+if not uploaded_files and not usar_almacen:
     st.info("Sube un archivo CSV para comenzar.")
-    st.stop()
+    _stop()
+
+# ====== Registro compartido de datasets (un objeto por proceso, sin copia por sesión) ======
+# DataFrames, cubos, catálogos y acumulados viven una sola vez en el servidor, indexados
+# por hash del contenido, con tope VENTAS_REGISTRY_MAX_MB y expulsión LRU. Son de solo lectura.
+@st.cache_resource(show_spinner=False)
+def _registry() -> DatasetRegistry:
+    return DatasetRegistry()
+
+registry = _registry()
+
+def _load_store_catalog(version: int) -> dict:
+    # Se reconstruye solo cuando cambia la versión del almacén
+    return registry.get(("catalogo", f"almacen-v{version}"), lambda: store_catalog(STORE_DIR))
+
+def _load_store_cumulative(version: int) -> dict:
+    # Acumulados para la comparación, desde el agregado diario del almacén
+    return registry.get(("acumulados", f"almacen-v{version}"),
+                        lambda: build_cumulative(build_daily_cube(read_daily(STORE_DIR))))
+
+# ====== Carga y preparación (registro en memoria y caché en disco, por archivo) ======
+# Por encima de este tamaño se usa por defecto la carga por bloques (agregado diario)
+STREAM_THRESHOLD_MB = float(os.environ.get("VENTAS_STREAM_MB", "200"))
+
+# dataset_key identifica la combinación de archivos (hashes en orden de carga);
+# _files solo se usa si hay que cargar.
+def _load_df(dataset_key: str, streaming: bool, _files: list) -> pd.DataFrame:
+    return registry.get(("df", dataset_key, streaming), lambda: load_dataset(_files, streaming))
+
+def _load_cube(dataset_key: str, streaming: bool, _files: list) -> pd.DataFrame:
+    # Cubo diario ítem × empresa × sede × fecha, una vez por dataset
+    return registry.get(("cubo", dataset_key, streaming),
+                        lambda: build_daily_cube(_load_df(dataset_key, streaming, _files)))
+
+# Con VENTAS_ENGINE=duckdb el catálogo y los pivots de los archivos subidos salen de consultas
+# sobre sus Parquet de la caché en disco; el DataFrame solo se carga si se pide la comparación,
+# el ranking o agregar al almacén (como los acumulados del almacén).
+USE_ENGINE = DEFAULT_ENGINE != "pandas"
+
+def _load_engine(dataset_key: str, streaming: bool, _files: list):
+    # None si los Parquet no quedaron en la caché: se sigue por pandas (en el registro queda False)
+    def load():
+        paths = prepared_paths(_files, streaming)
+        return open_engine(paths) if paths else False
+    return registry.get(("motor", dataset_key, streaming), load) or None
+
+def _load_catalog(dataset_key: str, streaming: bool, _files: list) -> dict:
+    # Catálogo de ítems distintos + índice de búsqueda, una vez por dataset
+    def load():
+        engine = _load_engine(dataset_key, streaming, _files) if USE_ENGINE else None
+        if engine is not None:
+            return engine.catalog()
+        return build_item_catalog(_load_df(dataset_key, streaming, _files))
+    return registry.get(("catalogo", dataset_key, streaming), load)
+
+def _load_cumulative(dataset_key: str, streaming: bool, _files: list) -> dict:
+    # Sumas acumuladas por (ítem, empresa, sede), una vez por dataset: cualquier ventana sale de dos lecturas
+    return registry.get(("acumulados", dataset_key, streaming),
+                        lambda: build_cumulative(_load_cube(dataset_key, streaming, _files)))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _load_invalid_dates(dataset_key: str, streaming: bool, _files: list) -> int:
+    # Filas cuya fecha_dcto no se pudo interpretar (quedan sin fecha y no entran en la tabla)
+    return int(_load_df(dataset_key, streaming, _files).attrs.get("fechas_invalidas", 0))
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _load_memory_report(dataset_key: str, streaming: bool, _files: list) -> pd.DataFrame:
+    return memory_report(_load_df(dataset_key, streaming, _files))
+
+if uploaded_files:
+    with stage("archivos", rows=len(uploaded_files)):
+        files = [f.getvalue() for f in uploaded_files]
+        # Hash del contenido, una vez por archivo subido
+        hashes = st.session_state.setdefault("file_hashes", {})
+        for f, data in zip(uploaded_files, files):
+            if f.file_id not in hashes:
+                hashes[f.file_id] = content_hash(data)
+    file_key = "+".join(hashes[f.file_id] for f in uploaded_files)
+
+    modo_bloques = st.sidebar.checkbox(
+        "Carga por bloques (archivos grandes)",
+        value=max(len(b) for b in files) > STREAM_THRESHOLD_MB * 1024 * 1024,
+        help="Lee el CSV por bloques y guarda solo el agregado diario por empresa, sede, ítem y fecha."
+    )
 
-# ====== Carga y preparación (cacheada) ======
-@st.cache_data(show_spinner=False)
-def _load_df(file_bytes: bytes) -> pd.DataFrame:
-    raw = pd.read_csv(io.BytesIO(file_bytes))
-    return prepare_dataframe(raw)
+    reemplazar = st.sidebar.checkbox(
+        "Reemplazar días ya cargados", value=True,
+        help="Los días (empresa, fecha) que ya estaban en el almacén se sustituyen por los de estos archivos "
+             "(gana el último export, como al unir archivos). Sin marcar, esas filas se omiten."
+    )
+    if st.sidebar.button("➕ Agregar días al almacén"):
+        try:
+            res = append_prepared(_load_df(file_key, modo_bloques, files), STORE_DIR, replace=reemplazar)
+            msg = f"{res['dias']} días ({res['filas']:,} filas) en {', '.join(res['meses']) or '—'}"
+            if res["reemplazados"]:
+                msg += f"; {res['reemplazados']} días ya cargados se reemplazaron"
+            if res["omitidas"]:
+                msg += f"; {res['omitidas']:,} filas omitidas por ser de días ya cargados"
+            st.session_state["store_msg"] = msg + "."
+            # Las versiones anteriores del almacén ya no se consultan: se liberan del registro
+            registry.discard(lambda k: str(k[1]).startswith("almacen-v"))
+            st.rerun()  # para habilitar "Consultar desde el almacén" con la nueva versión
+        except Exception as e:
+            st.sidebar.error(f"No se pudo actualizar el almacén: {e}")
+    if "store_msg" in st.session_state:
+        st.sidebar.success(st.session_state.pop("store_msg"))
+
+if usar_almacen:
+    file_key = f"almacen-v{store_version}"
+    with stage("carga", rows=lambda: len(catalog["items"])):
+        catalog = _load_store_catalog(store_version)
+    cube = engine = None
+else:
+    try:
+        with stage("carga", rows=lambda: len(catalog["items"])):
+            engine = _load_engine(file_key, modo_bloques, files) if USE_ENGINE else None
+            cube = None if engine is not None else _load_cube(file_key, modo_bloques, files)
+            catalog = _load_catalog(file_key, modo_bloques, files)
+    except Exception as e:
+        st.error(f"No se pudo procesar el CSV: {e}")
+        _stop()
+
+    if engine is not None:
+        # Sin DataFrame en memoria: no hay conteo de fechas inválidas ni reporte de memoria
+        st.sidebar.caption(f"Motor de consulta: {DEFAULT_ENGINE} (VENTAS_ENGINE)")
+    else:
+        n_invalidas = _load_invalid_dates(file_key, modo_bloques, files)
+        if n_invalidas:
+            st.sidebar.warning(f"{n_invalidas:,} filas con fecha_dcto no reconocida (se ignoran).")
 
-try:
-    df = _load_df(uploaded.getvalue())
-except Exception as e:
-    st.error(f"No se pudo procesar el CSV: {e}")
-    st.stop()
+        with st.sidebar.expander("Memoria del dataset"):
+            mem = _load_memory_report(file_key, modo_bloques, files)
+            st.caption(f"Total: {mem.loc['TOTAL', 'bytes'] / 1024 ** 2:,.1f} MB")
+            st.dataframe(mem, use_container_width=True)
+
+with st.sidebar.expander("Datasets en memoria (servidor)"):
+    st.caption(f"{registry.total_bytes / 1024 ** 2:,.1f} MB de {registry.max_bytes / 1024 ** 2:,.0f} MB "
+               "(VENTAS_REGISTRY_MAX_MB), compartidos por todas las sesiones.")
+    st.dataframe(registry.entries(), use_container_width=True, hide_index=True)
 
 # ====== Filtro de empresas ======
-EMPRESA_LABELS = {
-    "mercamio": "MERCAMIO",
-    "mtodo": "MERCATODO",
-    "bogota": "BOGOTÁ",
-}
-empresas_disponibles = sorted(df["empresa_norm"].dropna().unique().tolist())
+empresas_disponibles = sorted(catalog["spans"]["empresa_norm"].dropna().unique().tolist())
 labels = [EMPRESA_LABELS.get(x, x.upper()) for x in empresas_disponibles]
 
 st.subheader("Filtros")
@@ -58,40 +234,78 @@ empresas_sel = [label_to_key[l] for l in empresas_sel_labels] if empresas_sel_la
 
 if not empresas_sel:
     st.warning("Selecciona al menos una empresa para continuar.")
-    st.stop()
-
-# Filtramos por empresa antes de todo lo demás
-df = df[df["empresa_norm"].isin(empresas_sel)].copy()
-if df.empty:
-    st.warning("No hay datos para las empresas seleccionadas.")
-    st.stop()
+    _stop()
 
-# ====== Rango de fechas basado en las empresas filtradas ======
-if df["fecha"].notna().any():
-    min_d = df["fecha"].min().date()
-    max_d = df["fecha"].max().date()
-else:
+# ====== Rango de fechas basado en las empresas filtradas (desde el catálogo) ======
+bounds = catalog_date_bounds(catalog, empresas_sel)
+if bounds is None:
     st.error("No hay fechas válidas en el archivo.")
-    st.stop()
+    _stop()
+min_d, max_d = bounds[0].date(), bounds[1].date()
 
 c1, c2, c3 = st.columns([2,1,1])
 with c1:
     date_range = st.date_input("Rango de fechas (YYYY-MM-DD)", value=(min_d, max_d), format="YYYY-MM-DD")
 with c2:
     limit = st.number_input("Límite de ítems", min_value=1, max_value=10, value=10, step=1)
+with c3:
+    # Cambiar de medida no recalcula: todas salen del mismo pivot en caché
+    medida = st.radio("Medida", list(MEASURE_LABELS), format_func=MEASURE_LABELS.get, horizontal=True)
+    comparar = st.selectbox("Comparar con", [None] + list(COMPARISON_MODES),
+                            format_func=lambda m: COMPARISON_MODES.get(m, "Sin comparación"))
+medida_label = MEASURE_LABELS[medida]
 
 # ====== Ítems disponibles (ya restringidos por empresa y fechas para ayudar al usuario) ======
 start, end = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-mask_emp_fec = (df["fecha"] >= start) & (df["fecha"] <= end)
-df_emp_fec = df.loc[mask_emp_fec].copy()
-
-items_all = items_display_list(df_emp_fec if not df_emp_fec.empty else df)
-items_sel = st.multiselect("Ítems (por ID o descripción)", items_all, max_selections=limit)
+with stage("opciones_items"):
+    items_all = item_options(catalog, empresas_sel, start, end)
+
+def _cumulative() -> dict:
+    # Acumulados del dataset activo (archivos subidos o almacén)
+    if usar_almacen:
+        return _load_store_cumulative(store_version)
+    return _load_cumulative(file_key, modo_bloques, files)
+
+# ====== Ranking de ítems (top-N por sede y total, para elegir sin conocer los ids) ======
+@st.cache_data(show_spinner=False, max_entries=32)
+def _ranking(file_key: str, empresas: tuple, start, end, medida: str, n: int, _cumidx: dict) -> pd.DataFrame:
+    return top_items(_cumidx, list(empresas), start, end, medida, n)
+
+def _load_ranking(labels: list) -> None:
+    # Callback del botón: corre antes del siguiente rerun, así que puede fijar el valor del multiselect
+    st.session_state["items_sel"] = labels
+
+if st.checkbox("🏆 Ver ranking de ítems", help=f"Los ítems con más {medida_label.lower()} en el rango, por sede y en total."):
+    with stage("ranking", rows=lambda: len(ranking)):
+        r1, r2 = st.columns([1, 2])
+        with r1:
+            top_n = st.number_input("Top N", min_value=1, max_value=100, value=int(limit), step=1)
+        ranking = _ranking(file_key, tuple(empresas_sel), start, end, medida, int(top_n), _cumulative())
+        with r2:
+            ambitos = ranking["sede"].drop_duplicates().tolist() or [RANKING_ALL]
+            ambito = st.selectbox("Sede", ambitos,
+                                  format_func=lambda s: "Todas las sedes" if s == RANKING_ALL else s)
+        top = ranking[ranking["sede"] == ambito]
+        # Etiqueta "id - descripcion" de cada id, la primera de las opciones del multiselect
+        label_of = {}
+        for lbl in items_all:
+            label_of.setdefault(lbl.split(" - ", 1)[0], lbl)
+        vista_rank = pd.DataFrame({
+            "Puesto": top["puesto"].to_numpy(),
+            "Ítem": [label_of.get(i, i) for i in top["id_item"]],
+            medida_label: top["valor"].round(1).to_numpy(),
+        })
+        st.dataframe(vista_rank, use_container_width=True, hide_index=True)
+        cargar = [label_of[i] for i in top["id_item"] if i in label_of][:int(limit)]
+        st.button(f"Cargar los {len(cargar)} primeros en Ítems", on_click=_load_ranking, args=(cargar,),
+                  disabled=not cargar, help="Reemplaza la selección de ítems (hasta el límite de ítems).")
+
+items_sel = st.multiselect("Ítems (por ID o descripción)", items_all, max_selections=limit, key="items_sel")
 if not items_sel:
     # Título por defecto si no hay ítems aún
-    st.subheader("Tabla diaria consolidada (unidades)")
+    st.subheader(table_title([], medida))
     st.info("Selecciona al menos un ítem.")
-    st.stop()
+    _stop()
 
 # ====== TÍTULO DINÁMICO de la tabla según ítems (1ra palabra, en orden real de selección) =====
 if "items_order" not in st.session_state:
@@ -107,193 +321,144 @@ for it in current:
 # elimina los que ya no están seleccionados
 st.session_state["items_order"] = [it for it in st.session_state["items_order"] if it in current]
 
-def _first_word_from_option(opt: str) -> str:
-    # Si viene "123 - Descripción del producto", tomar solo la descripción
-    desc = opt.split(" - ", 1)[1] if " - " in opt else opt
-    desc = desc.strip()
+titulo_tabla = table_title(st.session_state["items_order"], medida)
 
-    # Limpieza básica: quita caracteres especiales al final (.,;:! etc)
-    desc = re.sub(r"[^\wÁÉÍÓÚáéíóúÑñ/ ]+", "", desc)
+# ====== Filtrado final por ítems (corte del cubo diario) ======
+ids = resolve_item_ids(catalog, items_sel)
 
-    if not desc:
-        return ""
+# Pivots numéricos (fecha × sede) de todas las medidas en una pasada, memorizados por filtros;
+# la tabla, las descargas y las gráficas usan el de la medida elegida.
+@st.cache_data(show_spinner=False, max_entries=32)
+def _pivots(file_key: str, empresas: tuple, start, end, items: tuple, _cube, _engine) -> dict:
+    if _engine is not None:
+        return _engine.pivot_measures(list(items), list(empresas), start, end)
+    if _cube is None:
+        return store_pivot_measures(list(items), list(empresas), start, end, STORE_DIR)
+    return cube_pivot_measures(_cube, list(items), list(empresas), start, end)
 
-    # Divide en palabras separadas por espacio, conservando expresiones como "C/RES"
-    palabras = desc.split()
+filter_key = (file_key, tuple(empresas_sel), start, end, tuple(sorted(ids)))
 
-    # Toma hasta 2 palabras
-    primeras = palabras[:2]
-    return " ".join(primeras)
-
-if st.session_state["items_order"]:
-    first_words = [_first_word_from_option(s) for s in st.session_state["items_order"]]
-    titulo_tabla = "Tabla diaria consolidada — " + " · ".join(first_words) + " (unidades)"
-else:
-    titulo_tabla = "Tabla diaria consolidada (unidades)"
-
-# ====== Filtrado final por ítems ======
-df_f = df_emp_fec.copy()
-ids = set()
-descr_needles = []
-for it in items_sel:
-    s = str(it)
-    if " - " in s:
-        ids.add(s.split(" - ", 1)[0].strip())
-    elif s.isdigit() or s.strip().isdigit():
-        ids.add(s.strip())
-    else:
-        descr_needles.append(s.lower().strip())
-
-ok = pd.Series(False, index=df_f.index)
-if ids:
-    ok = ok | df_f["id_item"].astype(str).isin(ids)
-if descr_needles:
-    pat = "|".join([re.escape(t) for t in descr_needles])  # usar re.escape
-    ok = ok | df_f["descripcion"].str.lower().str.contains(pat, na=False)
-df_f = df_f[ok]
+with stage("pivot", rows=lambda: len(pivot_num)):
+    pivot_num = _pivots(*filter_key, cube, engine)[medida]
 
 # ====== Tabla principal ======
-tabla = build_daily_table_all_range(df_f, start, end)
+with stage("tabla", rows=lambda: len(tabla)):
+    tabla = build_daily_table_from_pivot(pivot_num)
+
+# ====== Comparación con otro periodo (desde los acumulados, sin volver a filtrar filas) ======
+if comparar and not tabla.empty:
+    with stage("comparacion"):
+        cumidx = _cumulative()
+        comp_days = comparison_range(start, end, comparar)
+        comp_daily = cum_daily_totals(cumidx, ids, empresas_sel, comp_days)[medida]
+        comp_days = comp_days.dropna()   # el 29 de febrero no tiene equivalente en el año anterior
+        comp_totals = (cum_window_totals(cumidx, ids, empresas_sel, comp_days[0], comp_days[-1])[medida]
+                       if len(comp_days) else pd.Series(dtype="float64"))
+        tabla = add_comparison(tabla, comp_daily, comp_totals, COMPARISON_MODES[comparar])
+
+# ====== Trabajo en segundo plano: datos de gráficas y exportaciones ======
+# Con el pivot y la tabla calculados, el dataset de las gráficas va al pool de hilos compartido por
+# las sesiones (VENTAS_BG_WORKERS) y la tabla se dibuja sin esperarlo; el Excel y el CSV se adelantan
+# solo si el pool tiene hilos libres (si no, se generan al hacer clic). Los resultados quedan por
+# estado de filtros en la sesión y una selección nueva cancela lo pendiente de la anterior.
+CHART_WEEKLY_AFTER = int(os.environ.get("VENTAS_CHART_WEEKLY_DAYS", "92"))
+CHART_MONTHLY_AFTER = int(os.environ.get("VENTAS_CHART_MONTHLY_DAYS", "730"))
+
+@st.cache_resource(show_spinner=False)
+def _bg_pool():
+    return make_pool()
+
+def _csv_bytes(tabla: pd.DataFrame) -> bytes:
+    output_csv = io.BytesIO()
+    # Valores numéricos tal cual (0 en lugar de "-"), sin ".0" en los enteros
+    tabla.to_csv(output_csv, index=False, encoding="utf-8-sig", float_format="%.15g")
+    return output_csv.getvalue()
+
+def _chart_data(pivot: pd.DataFrame, freq: str) -> pd.DataFrame:
+    # Un solo dataset largo (periodo × sede, con "T. Dia" como una sede más) compartido por las cuatro gráficas
+    data = (
+        rollup_pivot(pivot, freq).rename_axis("fecha").reset_index()
+        .melt(id_vars="fecha", var_name="sede", value_name="valor")
+    )
+    data["fecha_dia"] = pd.to_datetime(data["fecha"]).dt.date
+    return data.drop(columns=["fecha"])
+
+def _chart_freq(resol_sel: str) -> str:
+    # Resolución: por encima de los umbrales (días) se agrupa por semana / mes en el servidor
+    if resol_sel == "Automática":
+        return choose_resolution(len(pivot_num), CHART_WEEKLY_AFTER, CHART_MONTHLY_AFTER)
+    return {v: k for k, v in CHART_RESOLUTIONS.items()}[resol_sel]
+
+def _timed(name: str, build):
+    # Corre fuera del rerun: con diagnóstico activo va al log como evento propio
+    if not diag_on:
+        return build
+    context = {"file_key": file_key, "filas": len(tabla)}
+    def run():
+        with timed_event(name, **context):
+            return build()
+    return run
+
+if not isinstance(st.session_state.get("precalculo"), Precomputed):   # nueva sesión o código recargado
+    st.session_state["precalculo"] = Precomputed(_bg_pool())
+precalculo = st.session_state["precalculo"]
+descarga_key = filter_key + (medida,)
+
+def _chart_future(freq: str):
+    name = ("graficas", freq)
+    return precalculo.submit(descarga_key, {name: _timed("datos_graficas", partial(_chart_data, pivot_num, freq))})[name]
+
+# Excel con formato de reporte (título, totales, domingos en rojo, "T. Dia" en negrita)
+exportaciones = {
+    ("excel", comparar, titulo_tabla): _timed("descarga_excel", partial(export_table_excel, tabla, titulo_tabla)),
+    ("csv", comparar): _timed("descarga_csv", partial(_csv_bytes, tabla)),
+}
+# El radio de resolución se dibuja más abajo (en el fragmento de gráficas); su valor está en session_state
+_chart_future(_chart_freq(st.session_state.get("resol_sel", "Automática")))
+precalculo.prefetch(descarga_key, exportaciones)
 
 st.subheader(titulo_tabla)
+if comparar and not tabla.empty and len(comp_days):
+    st.caption(f"Comparación: {COMPARISON_MODES[comparar].lower()} "
+               f"({comp_days[0]:%Y-%m-%d} a {comp_days[-1]:%Y-%m-%d}).")
 
 if tabla.empty:
     st.warning("No se encontraron registros para los filtros aplicados.")
 else:
-    # Estilos en pantalla (Streamlit)
-    def style_headers(df_styler):
-        return df_styler.set_table_styles([{'selector': 'th', 'props': [('font-weight', 'bold')]}])
-    def style_totals(row):
-        is_total = row.name == len(tabla) - 1
-        return ['font-weight: bold; background-color: #e6f2ff' if is_total else '' for _ in row]
-    def style_sundays(row):
-        is_sunday = isinstance(row['Fecha'], str) and ('/dom' in row['Fecha'])
-        if row.name == len(tabla) - 1:
-            return ['' for _ in row]
-        return ['color: red; font-weight: bold' if is_sunday else '' for _ in row]
-
-    sty = tabla.style.apply(style_totals, axis=1).apply(style_sundays, axis=1)
-    if "T. Dia" in tabla.columns:
-        sty = sty.set_properties(subset=['T. Dia'], **{'font-weight': 'bold'})
-    sty = style_headers(sty)
-    sty = sty.format(precision=2, na_rep="-")
-
-    st.dataframe(sty, use_container_width=True)
+    with stage("estilo", rows=len(tabla)):
+        # Estilos en pantalla (Streamlit): texto formateado de una vez y CSS como máscaras de toda la tabla
+        vista = format_table_display(tabla)
+
+        def style_table(df):
+            css = np.full(df.shape, "", dtype=object)
+            if "T. Dia" in df.columns:
+                css[:, df.columns.get_loc("T. Dia")] = "font-weight: bold"
+            n_footer = df.attrs.get("footer_rows", 1)
+            sundays = df["Fecha"].str.endswith("/dom").to_numpy(dtype=bool, copy=True)
+            sundays[-n_footer:] = False  # las filas de acumulado no se pintan como domingo
+            css[sundays] = "color: red; font-weight: bold"
+            css[-n_footer:] = "font-weight: bold; background-color: #e6f2ff"
+            return pd.DataFrame(css, index=df.index, columns=df.columns)
+
+        sty = vista.style.apply(style_table, axis=None)
+        sty = sty.set_table_styles([{'selector': 'th', 'props': [('font-weight', 'bold')]}])
+
+        st.dataframe(sty, use_container_width=True)
 
 # ====== DESCARGAS: Excel y CSV ======
-output_excel = io.BytesIO()
-output_csv = io.BytesIO()
-
-# CSV
-tabla.to_csv(output_csv, index=False, encoding="utf-8-sig")
-
-from xlsxwriter.utility import xl_rowcol_to_cell
-from datetime import datetime
-
-with pd.ExcelWriter(output_excel, engine="xlsxwriter") as writer:
-    # ==== Posición inicial ====
-    START_ROW = 5   # Fila 6 (0-based)
-    START_COL = 6   # Columna G (0-based)
-
-    # Escribimos la tabla (sin encabezado para personalizarlo)
-    tabla.to_excel(
-        writer,
-        sheet_name="Tabla Consolidada",
-        index=False,
-        header=False,
-        startrow=START_ROW + 1,
-        startcol=START_COL
-    )
-
-    workbook  = writer.book
-    worksheet = writer.sheets["Tabla Consolidada"]
-
-    # ==== Quitar cuadrícula ====
-    worksheet.hide_gridlines(2)
-
-    # ==== Formatos ====
-    fmt_titulo = workbook.add_format({
-        "bold": True, "font_color": "red",
-        "font_size": 12, "align": "center", "valign": "vcenter"
-    })
-    fmt_subtitulo = workbook.add_format({
-        "font_color": "black", "font_size": 11, "align": "center"
-    })
-    fmt_header = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "vcenter"})
-    fmt_sunday = workbook.add_format({"font_color": "red", "bold": True, "border": 1, "align": "center"})
-    fmt_total  = workbook.add_format({"bold": True, "bg_color": "#e6f2ff", "border": 1, "align": "center"})
-    fmt_num    = workbook.add_format({"num_format": "#,##0.##", "border": 1, "align": "center"})
-    fmt_text   = workbook.add_format({"border": 1, "align": "center"})
-    fmt_bold_num = workbook.add_format({"bold": True, "num_format": "#,##0.##", "border": 1, "align": "center"})
-
-    # ==== Construir título dinámico estilo reporte ====
-    mes_nombre = datetime.now().strftime("%B").capitalize() + " " + str(datetime.now().year)
-    titulo_excel = titulo_tabla.replace("Tabla diaria consolidada — ", "").replace("(unidades)", "").strip()
-    titulo_final = f"{mes_nombre.upper()}  Vta por día y acumulada de {titulo_excel.upper()}"
-
-    # Título principal en fila 4 (G4)
-    last_col_idx = START_COL + len(tabla.columns) - 1
-    worksheet.merge_range(START_ROW - 2, START_COL, START_ROW - 2, last_col_idx, titulo_final, fmt_titulo)
-
-    # ==== Cabecera en fila G6 ====
-    for c, col_name in enumerate(tabla.columns):
-        worksheet.write(START_ROW, START_COL + c, col_name, fmt_header)
-
-    # ==== Ajuste de ancho ====
-    for c, col_name in enumerate(tabla.columns):
-        col_series = tabla.iloc[:, c].astype(str)
-        width = max(col_series.map(len).max(), len(col_name)) + 2
-        worksheet.set_column(START_COL + c, START_COL + c, width)
-
-    # ==== Cuerpo de la tabla ====
-    data_first_row = START_ROW + 1
-    data_last_row  = data_first_row + len(tabla) - 2
-    for r in range(data_first_row, data_last_row + 1):
-        for c in range(len(tabla.columns)):
-            val = tabla.iloc[r - data_first_row, c]
-            if c == 0:
-                worksheet.write(r, START_COL + c, val, fmt_text)
-            else:
-                if isinstance(val, (int, float)):
-                    worksheet.write_number(r, START_COL + c, val, fmt_num)
-                else:
-                    worksheet.write(r, START_COL + c, val, fmt_text)
-
-    # ==== Fila de acumulado ====
-    total_row = data_last_row + 1
-    for c in range(len(tabla.columns)):
-        val = tabla.iloc[-1, c]
-        if c > 0 and isinstance(val, (int, float)):
-            worksheet.write_number(total_row, START_COL + c, val, fmt_total)
-        else:
-            worksheet.write(total_row, START_COL + c, val, fmt_total)
-
-    # ==== Domingos en rojo ====
-    fecha_col_abs = xl_rowcol_to_cell(data_first_row, START_COL, row_abs=False, col_abs=True)
-    worksheet.conditional_format(
-        data_first_row, START_COL,
-        total_row - 1, START_COL + len(tabla.columns) - 1,
-        {"type": "formula", "criteria": f'RIGHT({fecha_col_abs},3)="dom"', "format": fmt_sunday}
-    )
-
-    # ==== Columna "T. Dia" en negrita ====
-    if "T. Dia" in tabla.columns:
-        col_tdia_off = tabla.columns.get_loc("T. Dia")
-        col_abs = START_COL + col_tdia_off
-        for r in range(data_first_row, total_row):
-            val = tabla.iloc[r - data_first_row, col_tdia_off]
-            if isinstance(val, (int, float)):
-                worksheet.write_number(r, col_abs, val, fmt_bold_num)
-            else:
-                worksheet.write(r, col_abs, val, fmt_text)
+# data=callable: al hacer clic se toma el resultado adelantado o, si no se adelantó, se genera ahora
+def _on_click(name):
+    key, build = descarga_key, exportaciones[name]
+    return lambda: precalculo.submit(key, {name: build})[name].result()
 
+excel_bytes, csv_bytes = (_on_click(name) for name in exportaciones)
 
 # === BOTONES (lado a lado, alineados a la izquierda) ===
 b1, b2, _ = st.columns([1, 1, 6])
 with b1:
     st.download_button(
         "💾 Descargar Excel",
-        data=output_excel.getvalue(),
+        data=excel_bytes,
         file_name="tabla_diaria_items_sedes_TODAS.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
         use_container_width=True
@@ -301,7 +466,7 @@ with b1:
 with b2:
     st.download_button(
         "🧾 Descargar CSV",
-        data=output_csv.getvalue(),
+        data=csv_bytes,
         file_name="tabla_diaria_items_sedes_TODAS.csv",
         mime="text/csv",
         use_container_width=True
@@ -310,110 +475,134 @@ with b2:
 st.markdown("---")
 
 # ====== GRÁFICAS (Altair) ======
+# En un fragmento: cambiar distribución o resolución solo vuelve a correr esta parte. Si el dataset
+# aún se está calculando en el pool, se muestra un aviso y el fragmento consulta cada
+# CHART_POLL_SECONDS; al estar listo se hace un rerun completo, que dibuja las gráficas sin sondeo.
 st.subheader("Gráficas")
 
-# Pivot numérico
-pivot_num = build_numeric_pivot_range(df_f, start, end)
-
-# DataFrames para charts
-df_line = pivot_num.rename_axis('fecha').reset_index()
-df_line['fecha_dia'] = pd.to_datetime(df_line['fecha']).dt.date
-df_line = df_line.rename(columns={'T. Dia': 'T_Dia'})
-
-df_stack = (
-    pivot_num.drop(columns=["T. Dia"])
-    .rename_axis("fecha").reset_index()
-    .melt(id_vars="fecha", var_name="sede", value_name="unidades")
-)
-df_stack["fecha_dia"] = pd.to_datetime(df_stack["fecha"]).dt.date
-
-acum_por_sede = (
-    pivot_num.drop(columns=["T. Dia"])
-    .sum(axis=0)
-    .sort_values(ascending=False)
-    .rename_axis("sede")
-    .reset_index(name="unidades")
-)
-
-# selector de layout
-layout = st.radio("Distribución de gráficas", ["Una columna", "Dos columnas"], index=0, horizontal=True)
-
-# charts
-line_chart = (
-    alt.Chart(df_line, title="Total por día (T. Dia)")
-    .mark_line(point=True)
-    .encode(
-        x=alt.X("fecha_dia:T", axis=alt.Axis(title="Fecha", format="%d-%b")),
-        y=alt.Y("T_Dia:Q", axis=alt.Axis(title="Unidades")),
-        tooltip=[
-            alt.Tooltip("fecha_dia:T", title="Fecha", format="%Y-%m-%d"),
-            alt.Tooltip("T_Dia:Q", title="T. Dia", format=",.2f"),
-        ],
+CHART_POLL_SECONDS = 0.5
+CHART_WIDTH_FULL = 900
+CHART_WIDTH_HALF = 440
+
+chart_pending = not _chart_future(_chart_freq(st.session_state.get("resol_sel", "Automática"))).done()
+chart_first_pass = True
+
+@st.fragment(run_every=CHART_POLL_SECONDS if chart_pending else None)
+def _graficas():
+    g1, g2 = st.columns(2)
+    with g1:
+        # selector de layout
+        layout = st.radio("Distribución de gráficas", ["Una columna", "Dos columnas"], index=0, horizontal=True,
+                          key="layout_graficas")
+    with g2:
+        resol_sel = st.radio("Resolución", ["Automática"] + list(CHART_RESOLUTIONS.values()), index=0,
+                             horizontal=True, key="resol_sel")
+
+    freq = _chart_freq(resol_sel)
+    periodo = {"D": "día", "W": "semana", "M": "mes"}[freq]
+    if resol_sel == "Automática" and freq != "D":
+        st.caption(f"Rango de {len(pivot_num)} días: gráficas agrupadas por {periodo}.")
+
+    fut = _chart_future(freq)
+    if chart_pending:
+        if not fut.done():
+            st.info("Preparando gráficas…")
+            return
+        if not chart_first_pass:
+            st.rerun()
+    chart_data = fut.result()
+
+    fmt_x = "%b-%Y" if freq == "M" else "%d-%b"
+    titulo_x = {"D": "Fecha", "W": "Semana (desde)", "M": "Mes"}[freq]
+    por_sede = alt.datum.sede != "T. Dia"
+
+    # charts (sin data propia: heredan el dataset del gráfico compuesto)
+    line_chart = (
+        alt.Chart(title=f"Total por {periodo} (T. Dia)")
+        .transform_filter(alt.datum.sede == "T. Dia")
+        .mark_line(point=True)
+        .encode(
+            x=alt.X("fecha_dia:T", axis=alt.Axis(title=titulo_x, format=fmt_x)),
+            y=alt.Y("valor:Q", axis=alt.Axis(title=medida_label)),
+            tooltip=[
+                alt.Tooltip("fecha_dia:T", title=titulo_x, format="%Y-%m-%d"),
+                alt.Tooltip("valor:Q", title="T. Dia", format=",.2f"),
+            ],
+        )
+        .properties(height=260)
+        .interactive(name="zoom_linea")
     )
-    .properties(height=260)
-    .interactive()
-)
 
-stack_chart = (
-    alt.Chart(df_stack, title="Unidades por sede por día (apilado)")
-    .mark_bar()
-    .encode(
-        x=alt.X("fecha_dia:T", axis=alt.Axis(title="Fecha", format="%d-%b", labelAngle=-45)),
-        y=alt.Y("unidades:Q", stack="zero", axis=alt.Axis(title="Unidades")),
-        color=alt.Color("sede:N", legend=alt.Legend(title="Sede")),
-        tooltip=[
-            alt.Tooltip("fecha_dia:T", title="Fecha", format="%Y-%m-%d"),
-            alt.Tooltip("sede:N", title="Sede"),
-            alt.Tooltip("unidades:Q", title="Unidades", format=",.2f"),
-        ],
+    stack_chart = (
+        alt.Chart(title=f"{medida_label} por sede por {periodo} (apilado)")
+        .transform_filter(por_sede)
+        .mark_bar()
+        .encode(
+            x=alt.X("fecha_dia:T", axis=alt.Axis(title=titulo_x, format=fmt_x, labelAngle=-45)),
+            y=alt.Y("valor:Q", stack="zero", axis=alt.Axis(title=medida_label)),
+            color=alt.Color("sede:N", legend=alt.Legend(title="Sede")),
+            tooltip=[
+                alt.Tooltip("fecha_dia:T", title=titulo_x, format="%Y-%m-%d"),
+                alt.Tooltip("sede:N", title="Sede"),
+                alt.Tooltip("valor:Q", title=medida_label, format=",.2f"),
+            ],
+        )
+        .properties(height=320)
+        .interactive(name="zoom_apilado")
     )
-    .properties(height=320)
-    .interactive()
-)
 
-heatmap = (
-    alt.Chart(df_stack, title="Mapa de calor: unidades por sede y día")
-    .mark_rect()
-    .encode(
-        x=alt.X("fecha_dia:T", axis=alt.Axis(title="Fecha", format="%d-%b", labelAngle=-45)),
-        y=alt.Y("sede:N", sort='-x', axis=alt.Axis(title="Sede")),
-        color=alt.Color("unidades:Q", scale=alt.Scale(scheme="inferno"), legend=alt.Legend(title="Unidades")),
-        tooltip=[
-            alt.Tooltip("fecha_dia:T", title="Fecha", format="%Y-%m-%d"),
-            alt.Tooltip("sede:N", title="Sede"),
-            alt.Tooltip("unidades:Q", title="Unidades", format=",.2f"),
-        ],
+    heatmap = (
+        alt.Chart(title=f"Mapa de calor: {medida_label.lower()} por sede y {periodo}")
+        .transform_filter(por_sede)
+        .mark_rect()
+        .encode(
+            x=alt.X("fecha_dia:T", axis=alt.Axis(title=titulo_x, format=fmt_x, labelAngle=-45)),
+            y=alt.Y("sede:N", sort='-x', axis=alt.Axis(title="Sede")),
+            color=alt.Color("valor:Q", scale=alt.Scale(scheme="inferno"), legend=alt.Legend(title=medida_label)),
+            tooltip=[
+                alt.Tooltip("fecha_dia:T", title=titulo_x, format="%Y-%m-%d"),
+                alt.Tooltip("sede:N", title="Sede"),
+                alt.Tooltip("valor:Q", title=medida_label, format=",.2f"),
+            ],
+        )
+        .properties(height=320)
+        .interactive(name="zoom_calor")
     )
-    .properties(height=320)
-    .interactive()
-)
 
-acum_chart = (
-    alt.Chart(acum_por_sede, title="Acumulado del rango por sede")
-    .mark_bar()
-    .encode(
-        x=alt.X("sede:N", sort="-y", axis=alt.Axis(title="Sede")),
-        y=alt.Y("unidades:Q", axis=alt.Axis(title="Unidades")),
-        tooltip=[
-            alt.Tooltip("sede:N", title="Sede"),
-            alt.Tooltip("unidades:Q", title="Unidades", format=",.2f"),
-        ],
+    acum_chart = (
+        alt.Chart(title="Acumulado del rango por sede")
+        .transform_filter(por_sede)
+        .transform_aggregate(valor="sum(valor)", groupby=["sede"])
+        .mark_bar()
+        .encode(
+            x=alt.X("sede:N", sort="-y", axis=alt.Axis(title="Sede")),
+            y=alt.Y("valor:Q", axis=alt.Axis(title=medida_label)),
+            tooltip=[
+                alt.Tooltip("sede:N", title="Sede"),
+                alt.Tooltip("valor:Q", title=medida_label, format=",.2f"),
+            ],
+        )
+        .properties(height=260)
+        .interactive(name="zoom_acum")
     )
-    .properties(height=260)
-    .interactive()
-)
 
-if layout == "Una columna":
-    st.altair_chart(line_chart, use_container_width=True)
-    st.altair_chart(stack_chart, use_container_width=True)
-    st.altair_chart(heatmap, use_container_width=True)
-    st.altair_chart(acum_chart, use_container_width=True)
-else:
-    colA, colB = st.columns(2)
-    with colA:
-        st.altair_chart(line_chart, use_container_width=True)
-        st.altair_chart(heatmap, use_container_width=True)
-    with colB:
-        st.altair_chart(stack_chart, use_container_width=True)
-        st.altair_chart(acum_chart, use_container_width=True)
+    # Un solo gráfico compuesto: el dataset se serializa una vez para las cuatro vistas
+    if layout == "Una columna":
+        charts = alt.vconcat(
+            *[c.properties(width=CHART_WIDTH_FULL) for c in (line_chart, stack_chart, heatmap, acum_chart)],
+            data=chart_data,
+        )
+    else:
+        charts = alt.hconcat(
+            alt.vconcat(line_chart.properties(width=CHART_WIDTH_HALF), heatmap.properties(width=CHART_WIDTH_HALF)),
+            alt.vconcat(stack_chart.properties(width=CHART_WIDTH_HALF), acum_chart.properties(width=CHART_WIDTH_HALF)),
+            data=chart_data,
+        )
+    with stage("graficas"):
+        st.altair_chart(charts.resolve_scale(color="independent"), use_container_width=True)
+
+_graficas()
+chart_first_pass = False
+
+_finish()
 
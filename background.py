@@ -0,0 +1,110 @@
+# background.py — trabajo posterior a los filtros (datos de gráficas, Excel, CSV) en un pool de hilos acotado y compartido por las sesiones
+#
+# Con los filtros fijados, el dataset de las gráficas se envía al pool en cuanto se conoce
+# el pivot y la tabla se dibuja sin esperarlo; las exportaciones se adelantan solo si el
+# pool tiene hilos libres (si no, se generan al hacer clic). Cada sesión memoriza sus
+# resultados por estado de filtros.
+#
+#   pool = make_pool()                                # uno por proceso (st.cache_resource)
+#   pre = Precomputed(pool)                           # uno por sesión (st.session_state)
+#   futs = pre.submit(clave_filtros, {"graficas": lambda: ...})
+#   pre.prefetch(clave_filtros, {"csv": lambda: ...})  # solo si el pool está libre
+#   futs["graficas"].result()
+#
+# Si la selección cambia, las tareas de claves anteriores que aún no empezaron se
+# cancelan; las que ya corren terminan y su resultado queda para volver a esa selección.
+
+import os, threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+BG_WORKERS = int(os.environ.get("VENTAS_BG_WORKERS", "4"))
+
+# Claves de filtros con resultados que se conservan por sesión (volver atrás no recalcula)
+KEEP_KEYS = 8
+
+class BackgroundPool(ThreadPoolExecutor):
+    """ThreadPoolExecutor que sabe cuántas tareas tiene pendientes o corriendo."""
+
+    def __init__(self, workers: int):
+        super().__init__(max_workers=workers, thread_name_prefix="ventas-bg")
+        self.workers = workers
+        self._inflight = 0
+        self._count_lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._count_lock:
+            self._inflight += 1
+        try:
+            fut = super().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._done(None)
+            raise
+        fut.add_done_callback(self._done)   # también al cancelarse
+        return fut
+
+    def _done(self, _fut) -> None:
+        with self._count_lock:
+            self._inflight -= 1
+
+    def idle(self) -> bool:
+        """True si hay algún hilo libre (nada esperaría en cola)."""
+        with self._count_lock:
+            return self._inflight < self.workers
+
+def make_pool(workers: int = BG_WORKERS) -> BackgroundPool:
+    return BackgroundPool(max(1, workers))
+
+class Precomputed:
+    """Futures de una sesión por (clave de filtros, nombre de tarea)."""
+
+    def __init__(self, pool: BackgroundPool, keep: int = KEEP_KEYS):
+        self.pool = pool
+        self.keep = keep
+        self._by_key = OrderedDict()   # clave -> {nombre: Future}
+        self._lock = threading.Lock()   # los callbacks de descarga pueden llegar desde otros hilos
+
+    def submit(self, key, tasks: dict) -> dict:
+        """Futures de tasks (nombre -> callable sin argumentos) para key; cada tarea se envía una sola vez.
+
+        Cancela lo pendiente de las demás claves (una selección vieja no ocupa el pool).
+        """
+        with self._lock:
+            return self._submit(key, tasks, only_idle=False)
+
+    def prefetch(self, key, tasks: dict) -> dict:
+        """Como submit, pero solo envía las tareas que faltan mientras el pool tenga hilos libres."""
+        with self._lock:
+            return self._submit(key, tasks, only_idle=True)
+
+    def cancel_stale(self, key) -> int:
+        """Cancela las tareas no empezadas de claves distintas de key; devuelve cuántas."""
+        with self._lock:
+            return self._cancel_stale(key)
+
+    def _submit(self, key, tasks: dict, only_idle: bool) -> dict:
+        self._cancel_stale(key)
+        futures = self._by_key.setdefault(key, {})
+        self._by_key.move_to_end(key)
+        for name, fn in tasks.items():
+            fut = futures.get(name)
+            if fut is None or fut.cancelled():
+                if only_idle and not self.pool.idle():
+                    futures.pop(name, None)
+                    continue
+                futures[name] = self.pool.submit(fn)
+        while len(self._by_key) > self.keep:
+            for fut in self._by_key.popitem(last=False)[1].values():
+                fut.cancel()
+        return dict(futures)
+
+    def _cancel_stale(self, key) -> int:
+        n = 0
+        for k, futures in self._by_key.items():
+            if k == key:
+                continue
+            for name in list(futures):
+                if futures[name].cancel():
+                    del futures[name]
+                    n += 1
+        return n
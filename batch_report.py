@@ -0,0 +1,217 @@
+# batch_report.py — reportes "Vta por día y acumulada" en lote, sin Streamlit, en paralelo con un pool de procesos
+#
+# Uso:
+#   python batch_report.py ventas.csv grupos.csv --output-dir reportes/
+#   python batch_report.py ventas.csv grupos.json --single reportes.xlsx --workers 8
+#   python batch_report.py ventas.csv grupos.csv --output-dir reportes/ --engine duckdb   # sin cargar el CSV en memoria
+#
+# Archivo de grupos (CSV):  nombre,items,inicio,fin,empresas
+#   - items y empresas separados por ";" (empresas vacío = todas; inicio/fin vacíos = rango completo)
+#   - items pueden ser id_item o textos a buscar en la descripción
+# Archivo de grupos (JSON): lista de objetos con las mismas claves (items/empresas como listas).
+
+import os, sys, json, re, argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from utils import (
+    prepare_dataframe, prepare_csv_streaming,
+    build_daily_cube, cube_pivot_range, build_daily_table_from_pivot,
+    build_item_catalog, catalog_date_bounds, resolve_item_ids, table_title, empresa_key, CSV_DTYPES,
+)
+from excel_export import export_table_excel, export_tables_excel
+from query_engine import open_engine, ENGINES
+
+# Estado de cada proceso del pool (se entrega una vez por proceso en el initializer)
+_WORKER = {}
+
+def _split(value) -> list:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value).split(";") if v.strip()]
+
+def load_groups(path: str) -> list:
+    """Lista de dicts {nombre, items, inicio, fin, empresas} desde CSV o JSON."""
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            records = json.load(f)
+    else:
+        records = pd.read_csv(path, dtype=str, keep_default_na=False).to_dict("records")
+    groups = []
+    for i, r in enumerate(records, start=1):
+        items = _split(r.get("items"))
+        if not items:
+            raise ValueError(f"Grupo {i}: sin ítems")
+        groups.append({
+            "nombre": str(r.get("nombre") or f"grupo_{i}").strip(),
+            "items": items,
+            "inicio": r.get("inicio") or None,
+            "fin": r.get("fin") or None,
+            "empresas": [empresa_key(e) for e in _split(r.get("empresas"))],
+        })
+    return groups
+
+def load_dataset(csv_path: str, streaming: bool = False):
+    """Carga y prepara el CSV una sola vez; devuelve (cubo, catálogo)."""
+    if streaming:
+        df = prepare_csv_streaming(csv_path)
+    else:
+        df = prepare_dataframe(pd.read_csv(csv_path, dtype=CSV_DTYPES), copy=False)
+    return build_daily_cube(df), build_item_catalog(df)
+
+def check_groups(groups: list, catalog: dict) -> list:
+    """Avisos por grupo: empresas que no están en los datos e ítems sin ningún id_item conocido."""
+    known_ids = set(catalog["items"]["id_item"].astype(str))
+    known_emp = set(catalog["spans"]["empresa_norm"].dropna().astype(str))
+    warnings = []
+    for g in groups:
+        missing = [e for e in g["empresas"] if e not in known_emp]
+        if missing:
+            warnings.append(f"{g['nombre']}: empresas sin datos {missing}")
+        if not resolve_item_ids(catalog, g["items"]) & known_ids:
+            warnings.append(f"{g['nombre']}: ningún ítem de {g['items']} está en los datos (reporte vacío)")
+    return warnings
+
+def _guarded(fn, group: dict):
+    # (resultado, None) o (None, mensaje): un grupo con error no detiene a los demás
+    try:
+        return fn(group), None
+    except Exception as e:
+        return None, f"{group['nombre']}: {e}"
+
+def _collect(results, errors: list) -> list:
+    out = []
+    for res, err in results:
+        if err:
+            errors.append(err)
+        else:
+            out.append(res)
+    return out
+
+def _init_worker(cube, catalog):
+    _WORKER["cube"] = cube
+    _WORKER["catalog"] = catalog
+
+def _option_labels(catalog: dict, items: list) -> list:
+    # Etiquetas "id - descripcion" en el orden del grupo (para el título)
+    by_id = catalog["items"].drop_duplicates("id_item").set_index("id_item")["label"]
+    return [by_id.get(it, it) for it in items]
+
+def render_group(group: dict):
+    """Tabla consolidada del grupo: (nombre, tabla, titulo_tabla)."""
+    cube = _WORKER["cube"]
+    return _render(group, _WORKER["catalog"], lambda ids, emp, s, e: cube_pivot_range(cube, ids, emp, s, e))
+
+def _render(group: dict, catalog: dict, pivot_fn):
+    # pivot_fn(ids, empresas, start, end) -> pivot und_dia (cubo en memoria o motor de consulta)
+    empresas = group["empresas"] or catalog["spans"]["empresa_norm"].dropna().unique().tolist()
+    bounds = catalog_date_bounds(catalog, empresas)
+    if bounds is None:
+        raise ValueError(f"{group['nombre']}: no hay fechas válidas para {empresas}")
+    start = pd.to_datetime(group["inicio"]) if group["inicio"] else bounds[0]
+    end = pd.to_datetime(group["fin"]) if group["fin"] else bounds[1]
+
+    ids = resolve_item_ids(catalog, group["items"])
+    pivot = pivot_fn(sorted(ids), empresas, start, end)
+    tabla = build_daily_table_from_pivot(pivot)
+    return group["nombre"], tabla, table_title(_option_labels(catalog, group["items"]))
+
+def render_group_excel(group: dict):
+    return export_sheet(render_group(group))
+
+def export_sheet(sheet):
+    nombre, tabla, titulo = sheet
+    return nombre, export_table_excel(tabla, titulo)
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^\w\-]+", "_", name).strip("_") or "reporte"
+
+def _write_outputs(payloads, output_dir: str) -> list:
+    os.makedirs(output_dir, exist_ok=True)
+    written = []
+    for nombre, payload in payloads:
+        path = os.path.join(output_dir, f"{_slug(nombre)}.xlsx")
+        with open(path, "wb") as f:
+            f.write(payload)
+        written.append(path)
+    return written
+
+def run_engine(csv_path: str, groups: list, engine: str, output_dir: str = None, single: str = None,
+               workers: int = None) -> tuple[list, list, list]:
+    """Igual que run (devuelve (rutas escritas, avisos, errores por grupo)), pero los filtros y pivots corren en el motor de consulta sobre el CSV (sin cubo en memoria).
+
+    Las consultas se hacen en este proceso (el motor ya usa varios hilos); los .xlsx se escriben en el pool.
+    """
+    eng = open_engine([csv_path], engine)
+    catalog = eng.catalog()
+    pivot_fn = lambda ids, emp, s, e: eng.pivot_measures(ids, emp, s, e, ["und_dia"])["und_dia"]
+    errors = []
+    warnings = check_groups(groups, catalog)
+    sheets = _collect((_guarded(lambda g: _render(g, catalog, pivot_fn), g) for g in groups), errors)
+    if single:
+        if sheets:
+            with open(single, "wb") as f:
+                f.write(export_tables_excel(sheets))
+        return ([single] if sheets else []), warnings, errors
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return _write_outputs(pool.map(export_sheet, sheets), output_dir), warnings, errors
+
+def run(csv_path: str, groups_path: str, output_dir: str = None, single: str = None,
+        workers: int = None, streaming: bool = False, engine: str = None) -> tuple[list, list, list]:
+    """Genera los reportes; devuelve (rutas escritas, avisos, errores por grupo).
+
+    Un grupo que falla queda en errores y los demás se escriben igual.
+    """
+    groups = load_groups(groups_path)
+    if engine:
+        return run_engine(csv_path, groups, engine, output_dir, single, workers)
+    cube, catalog = load_dataset(csv_path, streaming)
+    warnings = check_groups(groups, catalog)
+
+    written, errors = [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cube, catalog)) as pool:
+        if single:
+            # Las tablas se calculan en paralelo; el libro se escribe en este proceso
+            sheets = _collect(pool.map(partial(_guarded, render_group), groups), errors)
+            if sheets:
+                with open(single, "wb") as f:
+                    f.write(export_tables_excel(sheets))
+                written.append(single)
+        else:
+            payloads = _collect(pool.map(partial(_guarded, render_group_excel), groups), errors)
+            written += _write_outputs(payloads, output_dir)
+    return written, warnings, errors
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Reportes diarios por grupo de ítems en lote.")
+    ap.add_argument("csv", help="CSV de ventas (mismo formato que la app)")
+    ap.add_argument("groups", help="archivo de grupos (.csv o .json)")
+    out = ap.add_mutually_exclusive_group(required=True)
+    out.add_argument("--output-dir", help="un .xlsx por grupo en esta carpeta")
+    out.add_argument("--single", help="un solo .xlsx con una hoja por grupo")
+    ap.add_argument("--workers", type=int, default=None, help="procesos del pool (por defecto: CPUs)")
+    ap.add_argument("--streaming", action="store_true", help="carga por bloques (agregado diario)")
+    ap.add_argument("--engine", choices=ENGINES, default=None,
+                    help="consultar el CSV con un motor (p. ej. duckdb) en lugar de cargarlo en memoria")
+    args = ap.parse_args(argv)
+
+    written, warnings, errors = run(args.csv, args.groups, args.output_dir, args.single, args.workers,
+                                    args.streaming, args.engine)
+    for path in written:
+        print(path)
+    for msg in warnings:
+        print(f"aviso: {msg}", file=sys.stderr)
+    for msg in errors:
+        print(f"error: {msg}", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
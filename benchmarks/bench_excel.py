@@ -0,0 +1,110 @@
+# benchmarks/bench_excel.py — exportación Excel celda a celda (versión anterior de app.py) vs excel_export
+#
+# Uso:  python benchmarks/bench_excel.py [dias] [sedes]
+
+import os, sys, io, time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from utils import build_daily_table_from_pivot, format_table_values, _order_sede_columns
+from excel_export import export_table_excel
+
+TITULO = "Tabla diaria consolidada — Leche Entera (unidades)"
+
+def _legacy_export(tabla: pd.DataFrame, titulo_tabla: str) -> bytes:
+    # Copia del bloque de exportación que vivía en app.py
+    from xlsxwriter.utility import xl_rowcol_to_cell
+    output_excel = io.BytesIO()
+    with pd.ExcelWriter(output_excel, engine="xlsxwriter") as writer:
+        START_ROW, START_COL = 5, 6
+        tabla.to_excel(writer, sheet_name="Tabla Consolidada", index=False, header=False,
+                       startrow=START_ROW + 1, startcol=START_COL)
+        workbook = writer.book
+        worksheet = writer.sheets["Tabla Consolidada"]
+        worksheet.hide_gridlines(2)
+        fmt_titulo = workbook.add_format({"bold": True, "font_color": "red", "font_size": 12, "align": "center", "valign": "vcenter"})
+        fmt_header = workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "vcenter"})
+        fmt_sunday = workbook.add_format({"font_color": "red", "bold": True, "border": 1, "align": "center"})
+        fmt_total = workbook.add_format({"bold": True, "bg_color": "#e6f2ff", "border": 1, "align": "center"})
+        fmt_num = workbook.add_format({"num_format": "#,##0.##", "border": 1, "align": "center"})
+        fmt_text = workbook.add_format({"border": 1, "align": "center"})
+        fmt_bold_num = workbook.add_format({"bold": True, "num_format": "#,##0.##", "border": 1, "align": "center"})
+        mes_nombre = datetime.now().strftime("%B").capitalize() + " " + str(datetime.now().year)
+        titulo_excel = titulo_tabla.replace("Tabla diaria consolidada — ", "").replace("(unidades)", "").strip()
+        titulo_final = f"{mes_nombre.upper()}  Vta por día y acumulada de {titulo_excel.upper()}"
+        last_col_idx = START_COL + len(tabla.columns) - 1
+        worksheet.merge_range(START_ROW - 2, START_COL, START_ROW - 2, last_col_idx, titulo_final, fmt_titulo)
+        for c, col_name in enumerate(tabla.columns):
+            worksheet.write(START_ROW, START_COL + c, col_name, fmt_header)
+        for c, col_name in enumerate(tabla.columns):
+            col_series = tabla.iloc[:, c].astype(str)
+            width = max(col_series.map(len).max(), len(col_name)) + 2
+            worksheet.set_column(START_COL + c, START_COL + c, width)
+        data_first_row = START_ROW + 1
+        data_last_row = data_first_row + len(tabla) - 2
+        for r in range(data_first_row, data_last_row + 1):
+            for c in range(len(tabla.columns)):
+                val = tabla.iloc[r - data_first_row, c]
+                if c == 0:
+                    worksheet.write(r, START_COL + c, val, fmt_text)
+                elif isinstance(val, (int, float)):
+                    worksheet.write_number(r, START_COL + c, val, fmt_num)
+                else:
+                    worksheet.write(r, START_COL + c, val, fmt_text)
+        total_row = data_last_row + 1
+        for c in range(len(tabla.columns)):
+            val = tabla.iloc[-1, c]
+            if c > 0 and isinstance(val, (int, float)):
+                worksheet.write_number(total_row, START_COL + c, val, fmt_total)
+            else:
+                worksheet.write(total_row, START_COL + c, val, fmt_total)
+        fecha_col_abs = xl_rowcol_to_cell(data_first_row, START_COL, row_abs=False, col_abs=True)
+        worksheet.conditional_format(data_first_row, START_COL, total_row - 1, START_COL + len(tabla.columns) - 1,
+                                     {"type": "formula", "criteria": f'RIGHT({fecha_col_abs},3)="dom"', "format": fmt_sunday})
+        if "T. Dia" in tabla.columns:
+            col_tdia_off = tabla.columns.get_loc("T. Dia")
+            col_abs = START_COL + col_tdia_off
+            for r in range(data_first_row, total_row):
+                val = tabla.iloc[r - data_first_row, col_tdia_off]
+                if isinstance(val, (int, float)):
+                    worksheet.write_number(r, col_abs, val, fmt_bold_num)
+                else:
+                    worksheet.write(r, col_abs, val, fmt_text)
+    return output_excel.getvalue()
+
+def _synthetic_table(days: int, sedes: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range("2023-01-01", periods=days, freq="D")
+    vals = rng.integers(0, 50, (days, sedes)).astype(float)
+    vals[rng.random(vals.shape) < 0.1] += 0.5
+    pt = pd.DataFrame(vals, index=idx, columns=[f"S{i:02d}" for i in range(sedes)])
+    return build_daily_table_from_pivot(_order_sede_columns(pt))
+
+def _timeit(fn, *args, repeat=3, **kw):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args, **kw)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main(days: int, sedes: int):
+    tabla = _synthetic_table(days, sedes)
+    # La versión anterior recibía la tabla ya formateada ("-", int, 1 decimal)
+    tabla_fmt = pd.DataFrame(format_table_values(tabla), columns=tabla.columns)
+    t_old = _timeit(_legacy_export, tabla_fmt, TITULO)
+    t_new = _timeit(export_table_excel, tabla, TITULO, constant_memory=False)
+    t_cm = _timeit(export_table_excel, tabla, TITULO, constant_memory=True)
+    print(f"tabla={tabla.shape[0]:,} filas x {tabla.shape[1]} columnas")
+    print(f"  legacy (celda a celda):        {t_old * 1000:10.1f} ms")
+    print(f"  export_table_excel:            {t_new * 1000:10.1f} ms  ({t_old / t_new:.1f}x)")
+    print(f"  export_table_excel (const mem):{t_cm * 1000:10.1f} ms  ({t_old / t_cm:.1f}x)")
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:3]]
+    main(*(args + [3650, 12][len(args):]))
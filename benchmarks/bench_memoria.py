@@ -0,0 +1,25 @@
+# benchmarks/bench_memoria.py — bytes por columna del CSV leído (antes) vs el DataFrame preparado (después)
+#
+# Uso:  python benchmarks/bench_memoria.py [filas]
+
+import os, sys, io
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from utils import prepare_dataframe, memory_report, CSV_DTYPES
+from synthetic import generate_sales
+
+def main(n: int):
+    data = generate_sales(n, items=5000, days=30).to_csv(index=False).encode()
+    before = pd.read_csv(io.BytesIO(data), dtype=CSV_DTYPES)
+    after = prepare_dataframe(pd.read_csv(io.BytesIO(data), dtype=CSV_DTYPES), copy=False)
+    rep = memory_report(after, before=before)
+    pd.set_option("display.width", 120)
+    print(f"filas={n:,}")
+    print(rep.to_string())
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,53 @@
+# benchmarks/bench_normalizacion.py — normalización fila a fila (.apply) vs normalize_keys (por valores distintos)
+#
+# Uso:  python benchmarks/bench_normalizacion.py [filas]
+
+import os, sys, time
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from utils import normalize_empresa, normalize_id_co, map_sede, normalize_keys
+
+def _legacy(df: pd.DataFrame) -> pd.DataFrame:
+    # Ruta anterior de prepare_dataframe
+    out = pd.DataFrame(index=df.index)
+    out["empresa_norm"] = df["empresa"].apply(normalize_empresa)
+    out["id_co_norm"] = df["id_co"].apply(normalize_id_co)
+    out["sede"] = [map_sede(e, i) for e, i in zip(df["empresa"], df["id_co"])]
+    return out
+
+def _synthetic(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    empresas = np.array(["Mercamio", "MTODO", "m.t", "Bogotá", "bogota "], dtype=object)
+    return pd.DataFrame({
+        "empresa": empresas[rng.integers(0, len(empresas), n)],
+        "id_co": rng.integers(1, 7, n),
+    })
+
+def _timeit(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        res = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, res
+
+def main(n: int):
+    df = _synthetic(n)
+    t_old, old = _timeit(_legacy, df)
+    t_new, new = _timeit(lambda d: normalize_keys(d["empresa"], d["id_co"]), df)
+
+    for c in ["empresa_norm", "id_co_norm", "sede"]:
+        assert (old[c].to_numpy() == new[c].astype(object).to_numpy()).all(), f"Diferencia en {c}"
+
+    print(f"filas={n:,}")
+    print(f"  legacy (.apply):  {t_old * 1000:10.1f} ms")
+    print(f"  normalize_keys:   {t_new * 1000:10.1f} ms")
+    print(f"  speedup:          {t_old / t_new:10.1f}x")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
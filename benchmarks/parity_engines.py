@@ -0,0 +1,157 @@
+# benchmarks/parity_engines.py — comprueba que los motores de query_engine.py dan el mismo resultado que la ruta pandas
+#
+# Uso:
+#   python benchmarks/parity_engines.py                      # pandas vs duckdb, 200k filas, 50 filtros al azar
+#   python benchmarks/parity_engines.py --rows 2000000 --checks 200
+#
+# Casos: varios CSV que se solapan (deduplicación entre archivos), valores "sucios"
+# (fechas como texto/float, empresas con tildes, medidas vacías), los Parquet de la
+# caché en disco y las partes del almacén. Sale con código 1 ante la primera diferencia.
+
+import os, sys, time, atexit, shutil, tempfile, argparse
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+# Los Parquet de la caché en disco de esta comprobación van a una carpeta temporal, no a la de la app
+if "VENTAS_CACHE_DIR" not in os.environ:
+    os.environ["VENTAS_CACHE_DIR"] = tempfile.mkdtemp(prefix="paridad-cache-")
+    atexit.register(shutil.rmtree, os.environ["VENTAS_CACHE_DIR"], ignore_errors=True)
+
+from utils import DAILY_MEASURES, pivot_measures_range
+from ingest import parse_and_prepare, load_dataset, prepared_paths
+from query_engine import open_engine
+from daily_store import append_prepared, store_pivot_measures
+from synthetic import generate_sales
+
+def _messy(df: pd.DataFrame, seed: int) -> pd.DataFrame:
+    # Formas de los exports reales que la normalización debe igualar
+    rng = np.random.default_rng(seed)
+    df = df.astype({"fecha_dcto": object, "und_dia": object, "empresa": object})
+    n = len(df)
+    pick = lambda frac: rng.random(n) < frac
+    f = df["fecha_dcto"].astype(str)
+    df.loc[pick(0.05), "fecha_dcto"] = f + ".0"
+    m = pick(0.05)
+    df.loc[m, "fecha_dcto"] = f[m].str[:4] + "-" + f[m].str[4:6] + "-" + f[m].str[6:]
+    df.loc[pick(0.001), "fecha_dcto"] = "sin fecha"
+    df.loc[pick(0.02), "empresa"] = " mercamio "
+    df.loc[pick(0.01), "und_dia"] = ""
+    return df
+
+def _read_prepared(path: str) -> pd.DataFrame:
+    with open(path, "rb") as f:
+        return parse_and_prepare(f.read())
+
+def _catalog_equal(a: dict, b: dict) -> bool:
+    if not a["items"].reset_index(drop=True).equals(b["items"].reset_index(drop=True)):
+        return False
+    if a["tokens"] != b["tokens"] or not np.array_equal(a["token_pos"], b["token_pos"]):
+        return False
+    key = lambda sp: sp.assign(empresa_norm=sp["empresa_norm"].astype(str)).sort_values(
+        ["pos", "empresa_norm"]).reset_index(drop=True)
+    return key(a["spans"]).equals(key(b["spans"]))
+
+def _pivots_equal(a: dict, b: dict) -> bool:
+    for m in a:
+        try:
+            pd.testing.assert_frame_equal(a[m], b[m], check_freq=False, check_names=False, rtol=1e-9)
+        except AssertionError as e:
+            print(f"  {m}: {e}")
+            return False
+    return True
+
+def _random_filters(catalog: dict, rng, n: int):
+    items = catalog["items"]["id_item"].unique()
+    empresas = catalog["spans"]["empresa_norm"].astype(str).unique()
+    lo, hi = catalog["spans"]["min"].min(), catalog["spans"]["max"].max()
+    days = (hi - lo).days
+    for _ in range(n):
+        a, b = sorted(rng.integers(-5, days + 5, 2))
+        yield (list(rng.choice(items, rng.integers(1, 11), replace=False)),
+               list(rng.choice(empresas, rng.integers(1, len(empresas) + 1), replace=False)),
+               lo + pd.Timedelta(days=int(a)), lo + pd.Timedelta(days=int(b)))
+
+def check(name: str, paths: list, engines: list, checks: int, seed: int, dedup: bool = True,
+          reference=None) -> bool:
+    print(f"== {name} ==")
+    opened = {}
+    for e in engines:
+        t0 = time.perf_counter()
+        opened[e] = open_engine(paths, e, dedup=dedup)
+        print(f"  abrir {e:<8} {time.perf_counter() - t0:8.2f} s")
+    base_name, base = engines[0], opened[engines[0]]
+    cat = base.catalog()
+    for e in engines[1:]:
+        if not _catalog_equal(cat, opened[e].catalog()):
+            print(f"  catálogo distinto: {base_name} vs {e}")
+            return False
+    rng = np.random.default_rng(seed)
+    for items, empresas, start, end in _random_filters(cat, rng, checks):
+        ref = base.pivot_measures(items, empresas, start, end)
+        others = [(e, opened[e].pivot_measures(items, empresas, start, end)) for e in engines[1:]]
+        if reference is not None:
+            others.append(("referencia", reference(items, empresas, start, end)))
+        for e, out in others:
+            if not _pivots_equal(ref, out):
+                print(f"  pivot distinto ({base_name} vs {e}): items={items} empresas={empresas} {start.date()}..{end.date()}")
+                return False
+    print(f"  ok: catálogo y {checks} filtros")
+    return True
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Paridad entre motores de consulta (pandas / duckdb).")
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--checks", type=int, default=50)
+    ap.add_argument("--engines", nargs="+", default=["pandas", "duckdb"])
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        # Dos archivos que se solapan en algunos días (gana el segundo) + uno de otra empresa
+        a = generate_sales(args.rows, items=500, days=60, start="2024-01-01", seed=args.seed)
+        b = generate_sales(args.rows // 2, items=500, days=30, start="2024-02-15", seed=args.seed + 1)
+        c = generate_sales(args.rows // 4, items=300, days=90, empresas=["bogota"], seed=args.seed + 2)
+        paths = []
+        for i, df in enumerate([_messy(a, 1), _messy(b, 2), c]):
+            paths.append(os.path.join(tmp, f"ventas_{i}.csv"))
+            df.to_csv(paths[-1], index=False)
+
+        # Referencia sin motor: la misma preparación que la carga de la app (ingest)
+        one = _read_prepared(paths[0])
+        def ref_one(items, empresas, start, end):
+            keep = (one["empresa_norm"].isin(empresas) & one["fecha"].between(start, end)
+                    & one["id_item"].astype(str).isin(items))
+            return pivot_measures_range(one[keep], start, end, DAILY_MEASURES)
+
+        ok &= check("un CSV", paths[:1], args.engines, args.checks, args.seed, reference=ref_one)
+        ok &= ok and check("varios CSV (con solapamiento)", paths, args.engines, args.checks, args.seed)
+
+        # Parquet de la caché en disco (archivos subidos con VENTAS_ENGINE=duckdb); referencia: load_dataset
+        blobs = [open(p, "rb").read() for p in paths]
+        merged = load_dataset(blobs)
+        def ref_merged(items, empresas, start, end):
+            keep = (merged["empresa_norm"].isin(empresas) & merged["fecha"].between(start, end)
+                    & merged["id_item"].astype(str).isin(items))
+            return pivot_measures_range(merged[keep], start, end, DAILY_MEASURES)
+        ok &= ok and check("caché en disco (Parquet)", prepared_paths(blobs), args.engines, args.checks, args.seed,
+                           reference=ref_merged)
+
+        # Partes Parquet del almacén (sin solapamiento); referencia: store_pivot_measures
+        store = os.path.join(tmp, "store")
+        for p in paths:
+            append_prepared(_read_prepared(p), store)
+        parts = sorted(os.path.join(root, f) for root, _, files in os.walk(os.path.join(store, "daily"))
+                       for f in files if f.endswith(".parquet"))
+        ok &= ok and check("almacén (Parquet)", parts, args.engines, args.checks, args.seed, dedup=False,
+                           reference=lambda i, e, s, f: store_pivot_measures(i, e, s, f, store, engine="pandas"))
+
+    print("PARIDAD OK" if ok else "DIFERENCIAS")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+# benchmarks/suite.py — tiempos de las rutas calientes de utils.py con datos sintéticos, comparados contra una línea base
+#
+# Uso:
+#   python benchmarks/suite.py                       # 100k y 1M filas, compara con baselines.json
+#   python benchmarks/suite.py --sizes 100k 1M 10M
+#   python benchmarks/suite.py --save                # guarda los tiempos actuales como línea base
+#
+# Sale con código 1 si algún caso es más lento que la línea base por encima de --threshold.
+
+import os, sys, io, json, math, time, argparse, platform
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from utils import (
+    parse_fecha, prepare_dataframe, items_display_list, build_item_catalog, item_options, CSV_DTYPES,
+    build_numeric_pivot_range, build_daily_table_all_range,
+    build_daily_cube, cube_pivot_range, cube_pivot_measures, build_cumulative, top_items,
+)
+from excel_export import export_table_excel
+from synthetic import generate_sales
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SIZES = {"100k": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+TITULO = "Tabla diaria consolidada — Leche Entera (unidades)"
+
+# Cada medición es un lote de llamadas que dura al menos esto (como timeit): los casos de
+# pocos ms no quedan a merced del ruido del reloj. Se mide tiempo de CPU del proceso
+# (process_time): en un servidor compartido el tiempo de pared suma lo que corren otros
+MIN_BATCH_SECONDS = 0.2
+
+def _measure(fn, repeat: int, setup=None, min_time: float = MIN_BATCH_SECONDS) -> float:
+    """Mejor tiempo por llamada (s) entre `repeat` lotes de al menos min_time.
+
+    Con setup, fn recibe setup() en cada llamada y la preparación queda fuera del tiempo.
+    La primera llamada fija el tamaño del lote (y calienta cachés).
+    """
+    def batch(number: int) -> float:
+        total = 0.0
+        for _ in range(number):
+            arg = setup() if setup else None
+            t0 = time.process_time()
+            fn(arg) if setup else fn()
+            total += time.process_time() - t0
+            del arg
+        return total
+
+    first = batch(1)
+    number = max(1, math.ceil(min_time / first)) if first > 0 else 1000
+    times = [first] if number == 1 else []
+    while len(times) < repeat:
+        times.append(batch(number) / number)
+    return min(times)
+
+def run_size(rows: int, days: int = 365, items: int = 5000, n_sel: int = 10) -> dict:
+    """Tiempos (s) por función para un dataset de `rows` filas.
+
+    Va por fases y suelta lo que ya no se usa (CSV en bytes, crudo, preparado): así 10M
+    filas caben en la memoria de un servidor normal.
+    """
+    repeat = 1 if rows >= 5_000_000 else 5
+    out = {}
+
+    # CSV en un buffer, escrito por bloques (sin un str intermedio del tamaño del archivo)
+    buf = io.BytesIO()
+    generate_sales(rows, items=items, days=days).to_csv(buf, index=False, chunksize=500_000)
+    def read():
+        buf.seek(0)
+        return pd.read_csv(buf, dtype=CSV_DTYPES)
+    out["read_csv"] = _measure(read, repeat)
+    raw = read()
+    del buf
+
+    out["parse_fecha"] = _measure(lambda: parse_fecha(raw["fecha_dcto"]), repeat)
+    # prepare_dataframe trabaja sobre su entrada (copy=False): una copia nueva del crudo por llamada
+    out["prepare_dataframe"] = _measure(lambda f: prepare_dataframe(f, copy=False), repeat, setup=raw.copy)
+    df = prepare_dataframe(raw, copy=False)
+    del raw
+
+    start, end = df["fecha"].min(), df["fecha"].max()
+    empresas = df["empresa_norm"].cat.categories
+    sel = [str(i) for i in df["id_item"].value_counts().index[:n_sel]]
+    df_f = df[df["id_item"].astype(str).isin(sel)]
+    catalog = build_item_catalog(df)
+    cube = build_daily_cube(df)
+    cumidx = build_cumulative(cube)
+    tabla = build_daily_table_all_range(df_f, start, end)
+
+    cases = {
+        "items_display_list": lambda: items_display_list(df),
+        "build_item_catalog": lambda: build_item_catalog(df),
+        "item_options": lambda: item_options(catalog, empresas, start, end),
+        "build_numeric_pivot_range": lambda: build_numeric_pivot_range(df_f, start, end),
+        "build_daily_table_all_range": lambda: build_daily_table_all_range(df_f, start, end),
+        "build_daily_cube": lambda: build_daily_cube(df),
+        "cube_pivot_range": lambda: cube_pivot_range(cube, sel, empresas, start, end),
+        "cube_pivot_measures": lambda: cube_pivot_measures(cube, sel, empresas, start, end),
+        "build_cumulative": lambda: build_cumulative(cube),
+        "top_items": lambda: top_items(cumidx, empresas, start, end, "und_dia", 20),
+        "export_table_excel": lambda: export_table_excel(tabla, TITULO),
+    }
+    for name, fn in cases.items():
+        out[name] = _measure(fn, repeat)
+    return out
+
+def load_baselines(path: str = BASELINES_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def compare(results: dict, baselines: dict, threshold: float) -> list:
+    """Filas (tamaño, caso, base, actual, ratio, regresión)."""
+    rows = []
+    for size, cases in results.items():
+        base_cases = baselines.get("results", {}).get(size, {})
+        for name, t in cases.items():
+            base = base_cases.get(name)
+            ratio = t / base if base else None
+            rows.append((size, name, base, t, ratio, bool(ratio and ratio > threshold)))
+    return rows
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmarks de utils.py con datos sintéticos.")
+    ap.add_argument("--sizes", nargs="+", default=["100k", "1M"], choices=list(SIZES))
+    ap.add_argument("--threshold", type=float, default=1.25, help="ratio actual/base a partir del cual se marca regresión")
+    ap.add_argument("--save", action="store_true", help="guardar los resultados como nueva línea base")
+    ap.add_argument("--baselines", default=BASELINES_PATH)
+    args = ap.parse_args(argv)
+
+    results = {}
+    for size in args.sizes:
+        print(f"== {size} filas ==", flush=True)
+        results[size] = run_size(SIZES[size])
+
+    baselines = load_baselines(args.baselines)
+    regressions = 0
+    print(f"\n{'tamaño':>6}  {'caso':<28} {'base (ms)':>10} {'actual (ms)':>12} {'ratio':>7}")
+    for size, name, base, t, ratio, bad in compare(results, baselines, args.threshold):
+        regressions += bad
+        base_s = f"{base * 1000:10.1f}" if base else f"{'-':>10}"
+        ratio_s = f"{ratio:7.2f}" if ratio else f"{'-':>7}"
+        print(f"{size:>6}  {name:<28} {base_s} {t * 1000:12.1f} {ratio_s}{'  << REGRESIÓN' if bad else ''}")
+
+    if args.save:
+        merged = baselines.get("results", {})
+        merged.update(results)
+        payload = {
+            "machine": {"python": platform.python_version(), "pandas": pd.__version__,
+                        "platform": platform.platform()},
+            "results": merged,
+        }
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2, sort_keys=True)
+        print(f"\nLínea base guardada en {args.baselines}")
+        return 0
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
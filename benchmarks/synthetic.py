@@ -0,0 +1,71 @@
+# benchmarks/synthetic.py — generador de ventas sintéticas con el esquema exacto que exige prepare_dataframe
+#
+# Uso:  python benchmarks/synthetic.py salida.csv --rows 1000000 --items 5000 --days 365
+
+import os, sys, argparse
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from utils import SEDE_MAP, REQUIRED_COLUMNS
+
+# Cómo llegan escritas las empresas en los exports del ERP
+EMPRESA_RAW = {"mercamio": "Mercamio", "mtodo": "MTODO", "bogota": "Bogotá"}
+
+LINEAS = ["ASEO", "LACTEOS", "GRANOS", "CARNES", "FRUVER", "BEBIDAS", "PANADERIA"]
+PALABRAS = ["LECHE", "ENTERA", "ARROZ", "CAFE", "AZUCAR", "ACEITE", "PAN", "TAJADO", "QUESO",
+            "POLLO", "RES", "JABON", "DETERGENTE", "GASEOSA", "AGUA", "HUEVO", "SAL", "PASTA"]
+
+def generate_sales(rows: int, items: int = 2000, days: int = 90, empresas=None,
+                   start: str = "2024-01-01", seed: int = 0) -> pd.DataFrame:
+    """DataFrame crudo con REQUIRED_COLUMNS; (empresa, id_co) sale de SEDE_MAP."""
+    rng = np.random.default_rng(seed)
+    empresas = list(empresas or SEDE_MAP.keys())
+    pares = [(EMPRESA_RAW.get(e, e), int(idc)) for e in empresas for idc in SEDE_MAP.get(e, {})]
+    sedes = rng.integers(0, len(pares), rows)
+
+    fechas = pd.date_range(start, periods=days, freq="D").strftime("%Y%m%d").astype(np.int64).to_numpy()
+
+    # Pocos ítems concentran la mayor parte de las filas, como en los exports reales
+    item_ids = np.arange(10_000, 10_000 + items)
+    peso = 1.0 / np.arange(1, items + 1)
+    item_idx = rng.choice(items, size=rows, p=peso / peso.sum())
+    w = rng.integers(0, len(PALABRAS), (items, 3))
+    descripciones = np.array([" ".join(PALABRAS[j] for j in fila) + f" {i % 900 + 100}G"
+                              for i, fila in enumerate(w)], dtype=object)
+    lineas = np.array(LINEAS, dtype=object)[rng.integers(0, len(LINEAS), items)]
+
+    und = rng.integers(0, 40, rows).astype(float)
+    precio = rng.uniform(1_000, 30_000, items)[item_idx]
+    df = pd.DataFrame({
+        "empresa": np.array([p[0] for p in pares], dtype=object)[sedes],
+        "fecha_dcto": fechas[rng.integers(0, days, rows)],
+        "id_co": np.array([p[1] for p in pares])[sedes],
+        "id_item": item_ids[item_idx],
+        "descripcion": descripciones[item_idx],
+        "linea": lineas[item_idx],
+        "und_dia": und,
+        "venta_sin_impuesto_dia": np.round(und * precio, 2),
+        "und_acum": (und * rng.integers(1, 30, rows)).astype(np.int64),
+        "venta_sin_impuesto_acum": np.round(und * precio * rng.integers(1, 30, rows), 2),
+    })
+    return df[REQUIRED_COLUMNS]
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Genera un CSV sintético de ventas por ítem.")
+    ap.add_argument("output")
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--items", type=int, default=2000)
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--empresas", nargs="*", default=None, choices=list(SEDE_MAP.keys()))
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    df = generate_sales(args.rows, args.items, args.days, args.empresas, seed=args.seed)
+    df.to_csv(args.output, index=False)
+    print(f"{args.output}: {len(df):,} filas")
+
+if __name__ == "__main__":
+    main()
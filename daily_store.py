@@ -0,0 +1,238 @@
+# daily_store.py — almacén local incremental: Parquet particionado por mes (filas preparadas + agregado diario)
+#
+# Estructura:
+#   <STORE_DIR>/manifest.json                       versión y días cargados por empresa
+#   <STORE_DIR>/rows/mes=YYYY-MM/part-<v>.parquet    filas preparadas
+#   <STORE_DIR>/daily/mes=YYYY-MM/part-<v>.parquet   aggregate_daily de esas filas
+#
+# Cada append escribe solo partes nuevas con los días (empresa, fecha) que aún no
+# estaban; así una actualización diaria cuesta O(filas nuevas). Con replace los meses
+# con días ya cargados se reescriben. Las partes se escriben antes que el manifiesto y
+# con nombre temporal hasta que están todas: un append que falla no deja nada a medias.
+
+import os, json, glob, tempfile
+
+import numpy as np
+import pandas as pd
+
+from utils import aggregate_daily, pivot_measures_range, build_item_catalog, DAILY_KEYS, DAILY_MEASURES
+from query_engine import open_engine, DEFAULT_ENGINE
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.environ.get("VENTAS_STORE_DIR", os.path.join(BASE_DIR, ".store"))
+
+# Columnas de texto que se guardan como str (esquema estable entre partes) y se leen como categóricas
+_CAT_COLS = ["empresa_norm", "id_co_norm", "sede", "id_item", "descripcion", "linea"]
+
+def _manifest_path(store_dir: str) -> str:
+    return os.path.join(store_dir, "manifest.json")
+
+def load_manifest(store_dir: str = STORE_DIR) -> dict:
+    path = _manifest_path(store_dir)
+    if not os.path.exists(path):
+        return {"version": 0, "days": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_atomic(path: str, write) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _save_manifest(manifest: dict, store_dir: str) -> None:
+    def write(tmp):
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+    _write_atomic(_manifest_path(store_dir), write)
+
+def _to_storage(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.copy(deep=False)
+    for c in _CAT_COLS:
+        if c in out:
+            out[c] = out[c].astype(str)
+    for c in DAILY_MEASURES:
+        if c in out:
+            out[c] = out[c].astype(np.float64)
+    return out
+
+def _from_storage(df: pd.DataFrame) -> pd.DataFrame:
+    for c in _CAT_COLS:
+        if c in df:
+            df[c] = df[c].astype("category")
+    return df
+
+def _month_dir(kind: str, month: str, store_dir: str) -> str:
+    return os.path.join(store_dir, kind, f"mes={month}")
+
+def _stage_part(df: pd.DataFrame, path: str) -> str:
+    # Escribe la parte con un nombre temporal (.tmp, que las lecturas ignoran) junto a su destino
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    os.close(fd)
+    try:
+        _to_storage(df).to_parquet(tmp, index=False)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return tmp
+
+def _swap_parts(plan: dict, rewrite: set, version: int, store_dir: str) -> None:
+    """Escribe las partes de plan ((kind, mes) -> DataFrame) y reemplaza las anteriores de los meses en rewrite.
+
+    Primero se escriben todas con nombre temporal: si algo falla (disco lleno, un DataFrame
+    inválido) el almacén queda como estaba. Después se renombran y se borran las partes viejas.
+    """
+    staged = []
+    try:
+        for (kind, month), df in plan.items():
+            if not df.empty:
+                path = os.path.join(_month_dir(kind, month, store_dir), f"part-{version:06d}.parquet")
+                staged.append((_stage_part(df, path), path))
+    except BaseException:
+        for tmp, _ in staged:
+            os.remove(tmp)
+        raise
+    old = [p for kind, month in rewrite for p in glob.glob(os.path.join(_month_dir(kind, month, store_dir), "*.parquet"))]
+    for tmp, path in staged:
+        os.replace(tmp, path)
+    new_paths = {path for _, path in staged}
+    for p in old:
+        if p not in new_paths:
+            os.remove(p)
+
+def _without_days(df: pd.DataFrame, pairs: set) -> pd.DataFrame:
+    if df.empty:
+        return df
+    key = pd.MultiIndex.from_arrays([df["empresa_norm"].astype(str).to_numpy(),
+                                     df["fecha"].dt.strftime("%Y-%m-%d").to_numpy()])
+    return df[~key.isin(list(pairs))]
+
+def append_prepared(df: pd.DataFrame, store_dir: str = STORE_DIR, replace: bool = False) -> dict:
+    """Agrega al almacén las filas cuyos días (empresa_norm, fecha) no estaban cargados.
+
+    Acepta un DataFrame de prepare_dataframe o el agregado diario de la carga por
+    bloques (en ese caso solo se actualiza daily/). Con replace=True los días que
+    ya existían se reemplazan: el mes afectado se reescribe sin esos días más los nuevos.
+    Devuelve {"filas", "dias", "meses", "version", "omitidas", "reemplazados"}: filas
+    agregadas, días nuevos o reemplazados, meses escritos, filas descartadas por ser de
+    días ya cargados (solo sin replace) y días (empresa, fecha) reemplazados.
+    """
+    manifest = load_manifest(store_dir)
+    df = df[df["fecha"].notna()]
+    emp = df["empresa_norm"].astype(str).to_numpy()
+    day = df["fecha"].dt.strftime("%Y-%m-%d").to_numpy()
+    known = [(e, d) for e, days in manifest["days"].items() for d in days]
+    pair_new = ~pd.MultiIndex.from_arrays([emp, day]).isin(known) if known else np.ones(len(df), dtype=bool)
+
+    replaced = set()
+    if replace and (~pair_new).any():
+        replaced = set(zip(emp[~pair_new], day[~pair_new]))
+        pair_new[:] = True
+
+    new = df[pair_new]
+    stats = {"filas": len(new), "dias": 0, "meses": [], "version": manifest["version"],
+             "omitidas": int((~pair_new).sum()), "reemplazados": len(replaced)}
+    if new.empty:
+        return stats
+
+    # Meses con días reemplazados: se reescriben enteros (lo que queda + lo nuevo) en una sola parte
+    rewrite = {(kind, d[:7]) for _, d in replaced for kind in ("rows", "daily")}
+    plan = {key: [_without_days(_read_parts(key[0], [key[1]], store_dir), replaced)] for key in sorted(rewrite)}
+    is_rows = "fecha_dcto" in new.columns
+    months = new["fecha"].dt.strftime("%Y-%m")
+    for month, part in new.groupby(months.to_numpy(), sort=True):
+        if is_rows:
+            plan.setdefault(("rows", month), []).append(part)
+        plan.setdefault(("daily", month), []).append(aggregate_daily(part) if is_rows else part)
+        stats["meses"].append(month)
+    plan = {key: pd.concat([f for f in frames if not f.empty] or frames[:1], ignore_index=True)
+            for key, frames in plan.items()}
+
+    # Partes primero (todas o ninguna), manifiesto al final
+    version = manifest["version"] + 1
+    _swap_parts(plan, rewrite, version, store_dir)
+    for e, d in replaced:
+        if d in manifest["days"].get(e, []):
+            manifest["days"][e].remove(d)
+    added = set(zip(emp[pair_new], day[pair_new]))
+    for e, d in added:
+        manifest["days"].setdefault(e, []).append(d)
+    for e in manifest["days"]:
+        manifest["days"][e] = sorted(set(manifest["days"][e]))
+    manifest["version"] = version
+    _save_manifest(manifest, store_dir)
+    stats.update(dias=len(added), version=version)
+    return stats
+
+def _read_parts(kind: str, months, store_dir: str, filters=None) -> pd.DataFrame:
+    paths = []
+    for m in months:
+        paths += sorted(glob.glob(os.path.join(store_dir, kind, f"mes={m}", "*.parquet")))
+    if not paths:
+        return pd.DataFrame()
+    parts = [pd.read_parquet(p, filters=filters) for p in paths]
+    return _from_storage(pd.concat(parts, ignore_index=True))
+
+def store_months(store_dir: str = STORE_DIR, kind: str = "daily") -> list:
+    return sorted(os.path.basename(p).split("=", 1)[1]
+                  for p in glob.glob(os.path.join(store_dir, kind, "mes=*")))
+
+def _months_between(start, end, store_dir: str) -> list:
+    months = store_months(store_dir)
+    if start is not None:
+        months = [m for m in months if m >= pd.Timestamp(start).strftime("%Y-%m")]
+    if end is not None:
+        months = [m for m in months if m <= pd.Timestamp(end).strftime("%Y-%m")]
+    return months
+
+def read_daily(store_dir: str = STORE_DIR, start=None, end=None, empresas=None, items=None) -> pd.DataFrame:
+    """Agregado diario del almacén, leyendo solo los meses del rango y filtrando empresas/ítems al leer."""
+    filters = []
+    if empresas is not None:
+        filters.append(("empresa_norm", "in", [str(e) for e in empresas]))
+    if items is not None:
+        filters.append(("id_item", "in", [str(i) for i in items]))
+    df = _read_parts("daily", _months_between(start, end, store_dir), store_dir, filters or None)
+    if df.empty:
+        return pd.DataFrame(columns=DAILY_KEYS + DAILY_MEASURES + ["descripcion", "linea"])
+    if start is not None:
+        df = df[df["fecha"] >= pd.Timestamp(start)]
+    if end is not None:
+        df = df[df["fecha"] <= pd.Timestamp(end)]
+    return df.reset_index(drop=True)
+
+def _daily_parts(store_dir: str, months) -> list:
+    return [p for m in months for p in sorted(glob.glob(os.path.join(store_dir, "daily", f"mes={m}", "*.parquet")))]
+
+def store_catalog(store_dir: str = STORE_DIR, engine: str = None) -> dict:
+    """build_item_catalog del almacén completo (con duckdb sin cargar el agregado en memoria)."""
+    parts = _daily_parts(store_dir, store_months(store_dir))
+    if (engine or DEFAULT_ENGINE) != "pandas" and parts:
+        return open_engine(parts, engine, dedup=False).catalog()
+    return build_item_catalog(read_daily(store_dir))
+
+def store_pivot_measures(items, empresas, start: pd.Timestamp, end: pd.Timestamp,
+                         store_dir: str = STORE_DIR, measures=DAILY_MEASURES, engine: str = None) -> dict:
+    """pivot_measures_range sobre el almacén: solo lee los meses y filas de esos ítems/empresas.
+
+    engine (por defecto VENTAS_ENGINE) "duckdb" hace el filtro y el pivot como consulta sobre las partes.
+    """
+    if (engine or DEFAULT_ENGINE) != "pandas":
+        parts = _daily_parts(store_dir, _months_between(start, end, store_dir))
+        if parts:
+            return open_engine(parts, engine, dedup=False).pivot_measures(items, empresas, start, end, measures)
+    df = read_daily(store_dir, start, end, empresas, items)
+    if df.empty:
+        out = {}
+        for m in measures:
+            pt = pd.DataFrame(index=pd.date_range(start=start, end=end, freq="D"))
+            pt["T. Dia"] = 0.0
+            out[m] = pt
+        return out
+    return pivot_measures_range(df, start, end, measures)
@@ -0,0 +1,128 @@
+# dataset_registry.py — registro en memoria de datasets preparados, compartido por todas las sesiones del servidor
+#
+# st.cache_data serializa el valor y entrega una copia nueva en cada rerun; con
+# varios usuarios sobre el mismo export la memoria se multiplica. Aquí cada
+# objeto (DataFrame preparado, cubo, catálogo, acumulados) vive una sola vez por
+# proceso, indexado por el hash del contenido, y todas las sesiones reciben el
+# mismo objeto (sin copia). Es de solo lectura: quien lo usa no debe modificarlo.
+#
+#   reg = DatasetRegistry(max_bytes=4 * 1024 ** 3)
+#   df = reg.get(("df", dataset_key, False), lambda: load_dataset(files))
+#   reg.entries()   # lo que está residente, del más reciente al más antiguo
+#
+# Con más de max_bytes se expulsa lo usado hace más tiempo (LRU). Una sesión que
+# aún tenga una referencia a un objeto expulsado lo sigue usando hasta soltarlo.
+
+import os, sys, time, threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+REGISTRY_MAX_BYTES = int(float(os.environ.get("VENTAS_REGISTRY_MAX_MB", "4096")) * 1024 * 1024)
+
+def object_nbytes(obj) -> int:
+    """Bytes aproximados de un objeto del registro (DataFrames en modo deep, arrays y contenedores)."""
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        return int(np.sum(obj.memory_usage(deep=True)))
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(object_nbytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(object_nbytes(v) for v in obj)
+    return sys.getsizeof(obj)
+
+def _freeze(obj):
+    # Los arrays compartidos quedan de solo lectura (un descuido en una sesión no altera a las demás)
+    if isinstance(obj, np.ndarray):
+        obj.flags.writeable = False
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            _freeze(v)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            _freeze(v)
+    return obj
+
+class DatasetRegistry:
+    """Objetos de solo lectura por clave, con tope de memoria total y expulsión LRU (seguro entre hilos)."""
+
+    def __init__(self, max_bytes: int = REGISTRY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # clave -> {"value", "bytes", "loaded", "last", "hits", "load_ms"}
+        self._loading = {}              # clave -> Lock: una sola carga por clave aunque la pidan varias sesiones
+
+    def get(self, key, load):
+        """Valor de key; si no está residente lo crea con load() (una vez, aunque lo pidan varias sesiones)."""
+        with self._lock:
+            hit = self._touch(key)
+            if hit is not None:
+                return hit
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                hit = self._touch(key)
+                if hit is not None:
+                    return hit
+            try:
+                t0 = time.perf_counter()
+                value = _freeze(load())
+                entry = {"value": value, "bytes": object_nbytes(value), "loaded": time.time(),
+                         "last": time.time(), "hits": 0, "load_ms": (time.perf_counter() - t0) * 1000}
+                with self._lock:
+                    self._entries[key] = entry
+                    self._evict(keep=key)
+            finally:
+                # También si load() falla: el lock de la clave no queda colgado en _loading
+                with self._lock:
+                    self._loading.pop(key, None)
+        return value
+
+    def _touch(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        entry["last"] = time.time()
+        entry["hits"] += 1
+        return entry["value"]
+
+    def _evict(self, keep) -> None:
+        # Desde el menos usado; el recién cargado se queda aunque por sí solo supere el tope
+        total = sum(e["bytes"] for e in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key)["bytes"]
+
+    def discard(self, match) -> int:
+        """Quita las claves para las que match(clave) es verdadero; devuelve cuántas."""
+        with self._lock:
+            keys = [k for k in self._entries if match(k)]
+            for k in keys:
+                del self._entries[k]
+        return len(keys)
+
+    @property
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(e["bytes"] for e in self._entries.values())
+
+    def entries(self) -> pd.DataFrame:
+        """Lo residente, del más reciente al más antiguo: clave, MB, usos, segundos de carga y antigüedad."""
+        now = time.time()
+        with self._lock:
+            rows = [{"clave": _label(k), "MB": round(e["bytes"] / 1024 ** 2, 1), "usos": e["hits"],
+                     "carga (s)": round(e["load_ms"] / 1000, 2), "último uso (s)": round(now - e["last"])}
+                    for k, e in reversed(self._entries.items())]
+        return pd.DataFrame(rows, columns=["clave", "MB", "usos", "carga (s)", "último uso (s)"])
+
+def _label(key) -> str:
+    # Hashes recortados a 12 caracteres para mostrar ("<hash>+<hash>" con varios archivos)
+    parts = key if isinstance(key, tuple) else (key,)
+    short = lambda p: "+".join(h[:12] if len(h) == 64 else h for h in p.split("+"))
+    return " · ".join(short(str(p)) for p in parts)
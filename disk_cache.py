@@ -0,0 +1,99 @@
+# disk_cache.py — caché en disco (Parquet) de DataFrames preparados, indexada por hash del contenido
+
+import os, hashlib, tempfile
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Configurable por variables de entorno
+CACHE_DIR = os.environ.get("VENTAS_CACHE_DIR", os.path.join(BASE_DIR, ".cache", "prepared"))
+CACHE_MAX_BYTES = int(float(os.environ.get("VENTAS_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+
+def content_hash(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+def _path_for(key: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, f"{key}.parquet")
+
+def cache_entries(cache_dir: str = CACHE_DIR):
+    """Lista (ruta, bytes, último acceso) de las entradas, de la más antigua a la más reciente."""
+    if not os.path.isdir(cache_dir):
+        return []
+    out = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".parquet"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            info = os.stat(path)
+        except OSError:
+            continue
+        out.append((path, info.st_size, info.st_mtime))
+    out.sort(key=lambda e: e[2])
+    return out
+
+def evict(max_bytes: int = CACHE_MAX_BYTES, cache_dir: str = CACHE_DIR) -> None:
+    # LRU: el mtime se actualiza en cada lectura, se borra desde el más antiguo
+    entries = cache_entries(cache_dir)
+    total = sum(e[1] for e in entries)
+    for path, size, _ in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def read_cached(key: str, cache_dir: str = CACHE_DIR, required=None):
+    """DataFrame guardado con esa clave, o None; con required, también None si le falta alguna de esas columnas."""
+    path = _path_for(key, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        df = pd.read_parquet(path)
+        missing = [c for c in (required or []) if c not in df.columns]
+        if missing:
+            raise ValueError(f"Entrada de caché sin columnas {missing}")
+        os.utime(path, None)
+        return df
+    except Exception:
+        # Archivo corrupto, incompleto o con otro esquema: se descarta y se recalcula
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+def cached_path(key: str, cache_dir: str = CACHE_DIR, required=None):
+    """Ruta del Parquet con esa clave para consultarlo sin cargarlo (motor de consulta), o None si no está o le faltan columnas."""
+    path = _path_for(key, cache_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        import pyarrow.parquet as pq
+        names = pq.read_schema(path).names
+    except Exception:
+        return None
+    if any(c not in names for c in (required or [])):
+        return None
+    os.utime(path, None)
+    return path
+
+def write_cached(key: str, df: pd.DataFrame, cache_dir: str = CACHE_DIR,
+                 max_bytes: int = CACHE_MAX_BYTES) -> bool:
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            df.to_parquet(tmp, index=True)
+            os.replace(tmp, _path_for(key, cache_dir))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    except Exception:
+        # Sin pyarrow, columnas no serializables o disco lleno: la caché es opcional
+        return False
+    evict(max_bytes, cache_dir)
+    return True
@@ -0,0 +1,155 @@
+# excel_export.py — exportación a Excel de la tabla diaria consolidada (escritura por filas, constant_memory opcional)
+
+import io, re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xlsxwriter
+from xlsxwriter.utility import xl_rowcol_to_cell
+
+from utils import format_table_values
+
+# ==== Posición inicial ====
+START_ROW = 5   # Fila 6 (0-based)
+START_COL = 6   # Columna G (0-based)
+
+SHEET_NAME = "Tabla Consolidada"
+
+# Por encima de este número de celdas se usa constant_memory por defecto
+CONSTANT_MEMORY_CELLS = 100_000
+
+def excel_title(titulo_tabla: str, now: datetime = None) -> str:
+    """Título estilo reporte: "<MES AÑO>  Vta por día y acumulada de <ÍTEMS>"."""
+    now = now or datetime.now()
+    mes_nombre = now.strftime("%B").capitalize() + " " + str(now.year)
+    titulo_excel = re.sub(r"\s*\([^)]*\)$", "", titulo_tabla.replace("Tabla diaria consolidada — ", "")).strip()
+    return f"{mes_nombre.upper()}  Vta por día y acumulada de {titulo_excel.upper()}"
+
+def _add_formats(workbook) -> dict:
+    return {
+        "titulo": workbook.add_format({
+            "bold": True, "font_color": "red",
+            "font_size": 12, "align": "center", "valign": "vcenter"
+        }),
+        "header": workbook.add_format({"bold": True, "border": 1, "align": "center", "valign": "vcenter"}),
+        "sunday": workbook.add_format({"font_color": "red", "bold": True, "border": 1, "align": "center"}),
+        "total": workbook.add_format({"bold": True, "bg_color": "#e6f2ff", "border": 1, "align": "center"}),
+        "num": workbook.add_format({"num_format": "#,##0.##", "border": 1, "align": "center"}),
+        "text": workbook.add_format({"border": 1, "align": "center"}),
+        "bold_num": workbook.add_format({"bold": True, "num_format": "#,##0.##", "border": 1, "align": "center"}),
+    }
+
+def _column_widths(values: np.ndarray, columns) -> list:
+    # Largo máximo de str() por columna, de una sola vez sobre toda la matriz
+    col_max = np.vectorize(lambda v: len(str(v)), otypes=[np.int64])(values).max(axis=0)
+    return [max(int(m), len(str(name))) + 2 for m, name in zip(col_max, columns)]
+
+def _report_values(tabla: pd.DataFrame) -> np.ndarray:
+    # Tabla numérica de build_daily_table_from_pivot -> valores del reporte ("-", int, 1 decimal);
+    # una tabla ya formateada se escribe tal cual
+    numeric = all(pd.api.types.is_numeric_dtype(tabla[c]) for c in tabla.columns if c != "Fecha")
+    return format_table_values(tabla) if numeric else tabla.to_numpy(dtype=object)
+
+def write_table_sheet(workbook, worksheet, tabla: pd.DataFrame, titulo_final: str, formats: dict = None) -> None:
+    """Escribe tabla (con filas finales de acumulado) en worksheet con el formato del reporte.
+
+    tabla.attrs["footer_rows"] indica cuántas filas finales son de totales (1 por defecto;
+    3 con comparación). Escribe estrictamente de arriba hacia abajo, así que funciona con constant_memory.
+    """
+    fmt = formats or _add_formats(workbook)
+    columns = list(tabla.columns)
+    n_cols = len(columns)
+    values = _report_values(tabla)
+    tdia = columns.index("T. Dia") if "T. Dia" in columns else None
+
+    # ==== Quitar cuadrícula ====
+    worksheet.hide_gridlines(2)
+
+    # ==== Ajuste de ancho ====
+    for c, width in enumerate(_column_widths(values, columns)):
+        worksheet.set_column(START_COL + c, START_COL + c, width)
+
+    # Título principal en fila 4 (G4)
+    last_col_idx = START_COL + n_cols - 1
+    if last_col_idx > START_COL:
+        worksheet.merge_range(START_ROW - 2, START_COL, START_ROW - 2, last_col_idx, titulo_final, fmt["titulo"])
+    else:
+        worksheet.write(START_ROW - 2, START_COL, titulo_final, fmt["titulo"])
+
+    # ==== Cabecera en fila G6 ====
+    worksheet.write_row(START_ROW, START_COL, columns, fmt["header"])
+
+    # ==== Cuerpo de la tabla (una llamada por fila) ====
+    data_first_row = START_ROW + 1
+    n_footer = tabla.attrs.get("footer_rows", 1)
+    body, footer = values[:-n_footer], values[-n_footer:]
+    for i, row in enumerate(body.tolist()):
+        r = data_first_row + i
+        worksheet.write(r, START_COL, row[0], fmt["text"])
+        end = tdia if tdia is not None else n_cols
+        if end > 1:
+            worksheet.write_row(r, START_COL + 1, row[1:end], fmt["num"])
+        if tdia is not None:
+            val = row[tdia]
+            worksheet.write(r, START_COL + tdia, val,
+                            fmt["bold_num"] if isinstance(val, (int, float)) else fmt["text"])
+            if tdia + 1 < n_cols:
+                worksheet.write_row(r, START_COL + tdia + 1, row[tdia + 1:], fmt["num"])
+
+    # ==== Filas de acumulado ====
+    total_row = data_first_row + len(body)
+    for i, row in enumerate(footer.tolist()):
+        worksheet.write_row(total_row + i, START_COL, row, fmt["total"])
+
+    # ==== Domingos en rojo ====
+    if len(body):
+        fecha_col_abs = xl_rowcol_to_cell(data_first_row, START_COL, row_abs=False, col_abs=True)
+        worksheet.conditional_format(
+            data_first_row, START_COL,
+            total_row - 1, START_COL + n_cols - 1,
+            {"type": "formula", "criteria": f'RIGHT({fecha_col_abs},3)="dom"', "format": fmt["sunday"]}
+        )
+
+def sheet_name_safe(name: str, used: set = None) -> str:
+    # Excel: máx. 31 caracteres, sin []:*?/\ y sin repetir
+    base = re.sub(r"[\[\]:*?/\\]", "_", str(name)).strip() or "Hoja"
+    base = base[:31]
+    out, n = base, 2
+    while used is not None and out.lower() in used:
+        suffix = f" ({n})"
+        out = base[:31 - len(suffix)] + suffix
+        n += 1
+    if used is not None:
+        used.add(out.lower())
+    return out
+
+def export_table_excel(tabla: pd.DataFrame, titulo_tabla: str, constant_memory: bool = None,
+                       sheet_name: str = SHEET_NAME) -> bytes:
+    """Genera el .xlsx de la tabla consolidada y devuelve sus bytes.
+
+    constant_memory=None lo activa automáticamente para tablas de más de CONSTANT_MEMORY_CELLS celdas.
+    """
+    if constant_memory is None:
+        constant_memory = tabla.size > CONSTANT_MEMORY_CELLS
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {"in_memory": not constant_memory, "constant_memory": constant_memory})
+    worksheet = workbook.add_worksheet(sheet_name)
+    write_table_sheet(workbook, worksheet, tabla, excel_title(titulo_tabla))
+    workbook.close()
+    return output.getvalue()
+
+def export_tables_excel(sheets, constant_memory: bool = None) -> bytes:
+    """Un libro con una hoja por (nombre_hoja, tabla, titulo_tabla), compartiendo formatos."""
+    sheets = list(sheets)
+    if constant_memory is None:
+        constant_memory = sum(t.size for _, t, _ in sheets) > CONSTANT_MEMORY_CELLS
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {"in_memory": not constant_memory, "constant_memory": constant_memory})
+    formats = _add_formats(workbook)
+    used = set()
+    for name, tabla, titulo_tabla in sheets:
+        worksheet = workbook.add_worksheet(sheet_name_safe(name, used))
+        write_table_sheet(workbook, worksheet, tabla, excel_title(titulo_tabla), formats)
+    workbook.close()
+    return output.getvalue()
@@ -0,0 +1,71 @@
+# ingest.py — lectura y preparación de uno o varios CSV (caché en disco por archivo, archivos nuevos en paralelo)
+
+import io, os, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils import prepare_dataframe, prepare_csv_streaming, merge_prepared, CSV_DTYPES, PREP_SIGNATURE, PREPARED_COLUMNS
+from disk_cache import content_hash, read_cached, write_cached, cached_path
+
+def parse_and_prepare(file_bytes: bytes) -> pd.DataFrame:
+    # Mismos dtypes que la carga por bloques: id_item "00123" no se convierte en "123.0"
+    raw = pd.read_csv(io.BytesIO(file_bytes), dtype=CSV_DTYPES)
+    return prepare_dataframe(raw, copy=False)
+
+def parse_streaming(file_bytes: bytes) -> pd.DataFrame:
+    return prepare_csv_streaming(io.BytesIO(file_bytes))
+
+def _cache_key(file_bytes: bytes, streaming: bool) -> str:
+    # Contenido + firma de la preparación (PREP_VERSION y SEDE_MAP): un cambio en utils invalida la caché
+    return f"{content_hash(file_bytes)}-{PREP_SIGNATURE}" + ("-daily" if streaming else "")
+
+def _prepare_and_cache(file_bytes: bytes, streaming: bool) -> pd.DataFrame:
+    # Corre en un proceso del pool: parsea, prepara y deja el resultado en la caché en disco
+    df = parse_streaming(file_bytes) if streaming else parse_and_prepare(file_bytes)
+    write_cached(_cache_key(file_bytes, streaming), df)
+    return df
+
+def _cache_only(file_bytes: bytes, streaming: bool) -> None:
+    # Como _prepare_and_cache, sin devolver el DataFrame al proceso principal
+    _prepare_and_cache(file_bytes, streaming)
+
+def _run_missing(fn, files: list, missing: list, streaming: bool, workers: int) -> dict:
+    # Un archivo en este proceso; varios en paralelo en procesos aparte
+    if len(missing) == 1:
+        return {missing[0]: fn(files[missing[0]], streaming)}
+    workers = min(len(missing), workers or os.cpu_count() or 1)
+    # spawn: el servidor de Streamlit tiene varios hilos y hacer fork de un proceso con hilos no es seguro
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {i: pool.submit(fn, files[i], streaming) for i in missing}
+        return {i: fut.result() for i, fut in futures.items()}
+
+def load_prepared_many(files: list, streaming: bool = False, workers: int = None) -> list:
+    """Un DataFrame preparado por archivo (mismo orden).
+
+    Los archivos ya vistos salen de la caché en disco; solo los nuevos se
+    parsean, en paralelo en procesos aparte cuando son más de uno.
+    """
+    out = [read_cached(_cache_key(b, streaming), required=PREPARED_COLUMNS) for b in files]
+    missing = [i for i, df in enumerate(out) if df is None]
+    if missing:
+        for i, df in _run_missing(_prepare_and_cache, files, missing, streaming, workers).items():
+            out[i] = df
+    return out
+
+def prepared_paths(files: list, streaming: bool = False, workers: int = None):
+    """Rutas de los Parquet preparados de cada archivo (mismo orden), para el motor de consulta.
+
+    Prepara y guarda en la caché los que falten sin cargarlos en este proceso. None si
+    alguno no quedó en la caché (sin pyarrow, disco lleno o expulsado por el tope).
+    """
+    keys = [_cache_key(b, streaming) for b in files]
+    missing = [i for i, k in enumerate(keys) if cached_path(k, required=PREPARED_COLUMNS) is None]
+    if missing:
+        _run_missing(_cache_only, files, missing, streaming, workers)
+    paths = [cached_path(k, required=PREPARED_COLUMNS) for k in keys]
+    return None if None in paths else paths
+
+def load_dataset(files: list, streaming: bool = False, workers: int = None) -> pd.DataFrame:
+    """Prepara cada archivo y los une deduplicando (ver utils.merge_prepared)."""
+    return merge_prepared(load_prepared_many(files, streaming, workers))
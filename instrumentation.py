@@ -0,0 +1,170 @@
+# instrumentation.py — tiempos, filas y memoria por etapa de cada rerun (panel de diagnóstico + log JSON lines)
+
+import os, sys, json, time, functools, tracemalloc, contextvars
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# Lectura de memoria: resource solo existe en Unix; psutil (opcional) cubre Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+METRICS_LOG = os.environ.get("VENTAS_METRICS_LOG", os.path.join(BASE_DIR, ".metrics", "runs.jsonl"))
+# tracemalloc da el pico de memoria por etapa pero hace todo más lento; solo si se pide
+TRACE_MEMORY = os.environ.get("VENTAS_METRICS_TRACEMALLOC", "0") == "1"
+
+# Registro activo del rerun actual (uno por hilo/sesión de Streamlit); None = sin medir
+_current = contextvars.ContextVar("ventas_metrics", default=None)
+
+def _max_rss_mb():
+    # Pico de memoria residente del proceso desde que arrancó (no por rerun); None si no hay cómo medirlo
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 1024 ** 2 if sys.platform == "darwin" else rss / 1024  # macOS: bytes, Linux: KB
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024 ** 2
+    return None
+
+def _rss_mb():
+    # Memoria residente actual (Linux: una lectura de /proc; si no, psutil si está instalado)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    return None
+
+def _round(x, nd=1):
+    return None if x is None else round(x, nd)
+
+def start_run(trace_memory: bool = TRACE_MEMORY, **context) -> dict:
+    """Empieza a registrar etapas en este hilo. Con trace_memory se mide el pico de asignaciones por etapa (tracemalloc)."""
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    rss = _rss_mb()
+    run = {"ts": datetime.now().isoformat(timespec="seconds"), "context": context, "stages": [],
+           "_depth": 0, "_t0": time.perf_counter(), "_trace": trace_memory, "_peaks": [],
+           "_rss0": rss, "_rss_max": rss}
+    _current.set(run)
+    return run
+
+def discard_run() -> None:
+    """Suelta el registro activo sin guardarlo (un rerun cortado por st.rerun() o una excepción no llega a finish_run)."""
+    _current.set(None)
+
+@contextmanager
+def stage(name: str, rows=None):
+    """Mide una etapa; rows puede ser un número o una función que se evalúa al terminar."""
+    run = _current.get()
+    if run is None:
+        yield
+        return
+    rec = {"stage": name, "depth": run["_depth"]}
+    run["stages"].append(rec)
+    run["_depth"] += 1
+    if run["_trace"]:
+        # reset_peak es global: se guarda el pico que llevaba la etapa padre antes de reiniciarlo
+        peaks = run["_peaks"]
+        if peaks:
+            peaks[-1] = max(peaks[-1], tracemalloc.get_traced_memory()[1])
+        peaks.append(0)
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        rec["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        run["_depth"] -= 1
+        rss = _rss_mb()
+        if rss is not None:
+            rec["rss_mb"] = round(rss, 1)
+            run["_rss_max"] = max(run["_rss_max"] or 0.0, rss)
+        if run["_trace"]:
+            peak = max(tracemalloc.get_traced_memory()[1], peaks.pop())
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak)
+            rec["peak_mb"] = round((peak - base) / 1024 ** 2, 2)
+        if callable(rows):
+            try:
+                rows = rows()
+            except Exception:
+                rows = None
+        if rows is not None:
+            rec["rows"] = int(rows)
+
+def instrumented(func):
+    """Decorador para funciones de utils: registra la llamada como etapa si hay un rerun midiéndose."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return func(*args, **kwargs)
+        with stage(func.__name__) as rec:
+            out = func(*args, **kwargs)
+            if hasattr(out, "shape") or isinstance(out, list):
+                rec["rows"] = len(out)
+            return out
+    return wrapper
+
+def finish_run(log_path: str = METRICS_LOG) -> dict:
+    """Cierra el rerun actual y lo añade como una línea JSON al log.
+
+    Memoria: rerun_rss_max_mb es el máximo de RSS muestreado al inicio y al final de cada
+    etapa del rerun y rerun_rss_delta_mb la diferencia final - inicio; max_rss_mb es el pico
+    del proceso desde que arrancó (no por rerun). Los picos dentro de una etapa solo con tracemalloc.
+    """
+    run = _current.get()
+    if run is None:
+        return None
+    _current.set(None)
+    rss = _rss_mb()
+    rss_max = max(run["_rss_max"] or 0.0, rss) if rss is not None else run["_rss_max"]
+    out = {
+        "ts": run["ts"],
+        "context": run["context"],
+        "total_ms": round((time.perf_counter() - run["_t0"]) * 1000, 2),
+        "rerun_rss_max_mb": _round(rss_max),
+        "rerun_rss_delta_mb": _round(rss - run["_rss0"]) if rss is not None and run["_rss0"] is not None else None,
+        "max_rss_mb": _round(_max_rss_mb()),
+        "stages": run["stages"],
+    }
+    log_event(out, log_path)
+    return out
+
+def log_event(record: dict, log_path: str = METRICS_LOG) -> None:
+    try:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    except OSError:
+        pass  # el log es opcional; nunca debe romper la app
+
+@contextmanager
+def timed_event(name: str, log_path: str = METRICS_LOG, **context):
+    """Para trabajo fuera del rerun (p. ej. descargas generadas al hacer clic): una línea propia en el log."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        log_event({"ts": datetime.now().isoformat(timespec="seconds"), "event": name, "context": context,
+                   "ms": round((time.perf_counter() - t0) * 1000, 2)}, log_path)
+
+def stages_frame(run: dict):
+    """Etapas de un rerun como DataFrame para el panel (nombre sangrado según anidamiento)."""
+    rows = [{"etapa": "\u2003" * r["depth"] + r["stage"], "ms": r.get("ms"), "filas": r.get("rows"),
+             "RSS (MB)": r.get("rss_mb"), "pico (MB)": r.get("peak_mb")} for r in run["stages"]]
+    out = pd.DataFrame(rows).dropna(axis=1, how="all")
+    if "filas" in out:
+        out["filas"] = out["filas"].astype("Int64")
+    return out
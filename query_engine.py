@@ -0,0 +1,185 @@
+# query_engine.py — motor de consulta intercambiable para filtrar y pivotar (pandas en memoria o DuckDB fuera de memoria)
+#
+# Ambos motores exponen lo mismo sobre una lista de archivos locales:
+#   - CSV crudos (mismo formato que la app): se normalizan igual que prepare_dataframe
+#     (columnas de texto leídas como str, igual que la carga por bloques)
+#   - Parquet ya preparados (caché en disco o partes del almacén)
+#
+#   eng = open_engine(["ventas_ene.csv", "ventas_feb.csv"], engine="duckdb")
+#   eng.catalog()                                            # como build_item_catalog
+#   eng.pivot_measures(items, empresas, start, end)          # como pivot_measures_range
+#
+# Se elige con VENTAS_ENGINE=pandas|duckdb (por defecto pandas). Con DuckDB los
+# filtros de empresa/fecha/ítem y el pivot fecha × sede corren como consultas
+# sobre los archivos: en memoria solo quedan los valores distintos y el resultado.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import (
+    prepare_dataframe, merge_prepared, normalize_keys, parse_fecha, _strip_str,
+    build_item_catalog, pivot_measures_range, _split_measures,
+    CSV_DTYPES, REQUIRED_COLUMNS, DAILY_MEASURES, MERGE_KEYS,
+)
+
+ENGINES = ("pandas", "duckdb")
+DEFAULT_ENGINE = os.environ.get("VENTAS_ENGINE", "pandas")
+
+# Columnas que se leen de un Parquet preparado
+_PREPARED_COLS = ["empresa_norm", "id_co_norm", "sede", "id_item", "descripcion", "fecha"] + DAILY_MEASURES
+_CAT_COLS = ["empresa_norm", "id_co_norm", "sede", "id_item", "descripcion"]
+
+def _is_csv(path: str) -> bool:
+    return str(path).lower().endswith(".csv")
+
+def open_engine(paths, engine: str = None, dedup: bool = True):
+    """Motor sobre esos archivos (en orden de carga).
+
+    dedup=True aplica la regla de merge_prepared entre archivos (por MERGE_KEYS
+    gana el último); las partes del almacén no se solapan y pueden pasar False.
+    """
+    engine = engine or DEFAULT_ENGINE
+    if engine == "pandas":
+        return PandasEngine(paths, dedup)
+    if engine == "duckdb":
+        return DuckDBEngine(paths, dedup)
+    raise ValueError(f"Motor desconocido: {engine!r} (opciones: {', '.join(ENGINES)})")
+
+# ====== pandas: todo en memoria (ruta de siempre) ======
+class PandasEngine:
+    name = "pandas"
+
+    def __init__(self, paths, dedup: bool = True):
+        self.df = merge_prepared([self._read(p) for p in paths], dedup)
+
+    @staticmethod
+    def _read(path: str) -> pd.DataFrame:
+        if _is_csv(path):
+            return prepare_dataframe(pd.read_csv(path, dtype=CSV_DTYPES), copy=False)
+        df = pd.read_parquet(path, columns=_PREPARED_COLS)
+        for c in _CAT_COLS:
+            df[c] = df[c].astype(str).astype("category")
+        return df
+
+    def catalog(self) -> dict:
+        return build_item_catalog(self.df)
+
+    def pivot_measures(self, items, empresas, start, end, measures=DAILY_MEASURES) -> dict:
+        df = self.df
+        keep = (df["empresa_norm"].isin(list(empresas)) & (df["fecha"] >= start) & (df["fecha"] <= end)
+                & df["id_item"].astype(str).isin([str(i) for i in items]))
+        return pivot_measures_range(df[keep], start, end, measures)
+
+# ====== DuckDB: consultas sobre los archivos ======
+class DuckDBEngine:
+    name = "duckdb"
+
+    def __init__(self, paths, dedup: bool = True):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("VENTAS_ENGINE=duckdb requiere el paquete duckdb (pip install duckdb)") from e
+        self.con = duckdb.connect()
+        paths = [str(p) for p in paths]
+        if not paths:
+            raise ValueError("No hay archivos para consultar")
+        csvs = [p for p in paths if _is_csv(p)]
+        if csvs:
+            self._load_csv_keys(csvs)
+        parts = [self._csv_select(i, p) if _is_csv(p) else self._parquet_select(i, p) for i, p in enumerate(paths)]
+        union = "\nUNION ALL\n".join(parts)
+        if dedup and len(paths) > 1:
+            keys = ", ".join(MERGE_KEYS)
+            union = f"SELECT * FROM ({union}) QUALIFY src = max(src) OVER (PARTITION BY {keys})"
+        self.con.execute(f"CREATE VIEW ventas AS {union}")
+
+    @staticmethod
+    def _quote(path: str) -> str:
+        return "'" + path.replace("'", "''") + "'"
+
+    def _raw(self, path: str) -> str:
+        return f"read_csv({self._quote(path)}, header=true, delim=',', quote='\"', all_varchar=true)"
+
+    def _load_csv_keys(self, csvs: list) -> None:
+        # Valores distintos de empresa/id_co y fecha_dcto -> se normalizan con las mismas funciones de utils
+        raw = "\nUNION ALL\n".join(f"SELECT * FROM {self._raw(p)}" for p in csvs)
+        cols = self.con.execute(f"SELECT * FROM ({raw}) LIMIT 0").df().columns
+        missing = [c for c in REQUIRED_COLUMNS if c not in cols]
+        if missing:
+            raise ValueError(f"Faltan columnas en el CSV: {missing}")
+
+        pairs = self.con.execute(f"SELECT DISTINCT empresa, id_co FROM ({raw})").df()
+        pairs = pairs.astype(object).where(pairs.notna(), np.nan)
+        keys = normalize_keys(pairs["empresa"], pairs["id_co"]).astype(str)
+        claves = pd.concat([pairs.rename(columns={"empresa": "empresa_raw", "id_co": "id_co_raw"}), keys], axis=1)
+
+        fechas = self.con.execute(f"SELECT DISTINCT fecha_dcto FROM ({raw})").df()
+        fechas = fechas.astype(object).where(fechas.notna(), np.nan)
+        fechas["fecha"] = parse_fecha(fechas["fecha_dcto"])
+
+        self.con.register("_claves", claves)
+        self.con.register("_fechas", fechas)
+        self.con.execute("CREATE TABLE claves AS SELECT * FROM _claves")
+        self.con.execute("CREATE TABLE fechas AS SELECT * FROM _fechas")
+        self.con.unregister("_claves")
+        self.con.unregister("_fechas")
+
+    def _csv_select(self, i: int, path: str) -> str:
+        # Equivalente perezoso de prepare_dataframe (solo las columnas que se consultan)
+        def measure(c):
+            return f"COALESCE(TRY_CAST(trim(r.{c}) AS DOUBLE), 0.0) AS {c}"
+        return f"""
+            SELECT {i} AS src, k.empresa_norm, k.id_co_norm, k.sede,
+                   COALESCE(r.id_item, 'nan') AS id_item, r.descripcion, f.fecha,
+                   {', '.join(measure(c) for c in DAILY_MEASURES)}
+            FROM {self._raw(path)} r
+            JOIN claves k ON r.empresa IS NOT DISTINCT FROM k.empresa_raw AND r.id_co IS NOT DISTINCT FROM k.id_co_raw
+            JOIN fechas f ON r.fecha_dcto IS NOT DISTINCT FROM f.fecha_dcto"""
+
+    def _parquet_select(self, i: int, path: str) -> str:
+        cols = ", ".join(f"CAST({c} AS VARCHAR) AS {c}" for c in _CAT_COLS if c != "descripcion")
+        measures = ", ".join(f"CAST({c} AS DOUBLE) AS {c}" for c in DAILY_MEASURES)
+        return f"""
+            SELECT {i} AS src, {cols}, CAST(descripcion AS VARCHAR) AS descripcion,
+                   CAST(fecha AS TIMESTAMP) AS fecha, {measures}
+            FROM read_parquet({self._quote(path)})"""
+
+    def _query(self, sql: str, params=None) -> pd.DataFrame:
+        # Un cursor por consulta: el motor se comparte entre sesiones (hilos) y una conexión no es segura entre hilos
+        cur = self.con.cursor()
+        try:
+            return cur.execute(sql, params).df()
+        finally:
+            cur.close()
+
+    def catalog(self) -> dict:
+        # Min/max de fecha por (ítem, descripción, empresa) en DuckDB; build_item_catalog sobre esas pocas filas
+        spans = self._query("""
+            SELECT id_item, descripcion, empresa_norm, min(fecha) AS fmin, max(fecha) AS fmax
+            FROM ventas GROUP BY ALL""")
+        desc = spans["descripcion"].astype(object).where(spans["descripcion"].notna(), np.nan)
+        base = pd.DataFrame({
+            "id_item": np.repeat(spans["id_item"].to_numpy(dtype=object), 2),
+            "descripcion": np.repeat(desc.map(_strip_str).to_numpy(dtype=object), 2),
+            "empresa_norm": np.repeat(spans["empresa_norm"].to_numpy(dtype=object), 2),
+            "fecha": np.column_stack([spans["fmin"], spans["fmax"]]).ravel(),
+        })
+        base["fecha"] = pd.to_datetime(base["fecha"])
+        base["empresa_norm"] = base["empresa_norm"].astype("category")
+        return build_item_catalog(base)
+
+    def pivot_measures(self, items, empresas, start, end, measures=DAILY_MEASURES) -> dict:
+        measures = list(measures)
+        sums = ", ".join(f"sum({m}) AS {m}" for m in measures)
+        grouped = self._query(f"""
+            SELECT fecha, sede, {sums} FROM ventas
+            WHERE list_contains($empresas, empresa_norm) AND list_contains($items, id_item)
+              AND fecha BETWEEN $start AND $end
+            GROUP BY fecha, sede""",
+            {"empresas": [str(e) for e in empresas], "items": [str(i) for i in items],
+             "start": pd.Timestamp(start).to_pydatetime(), "end": pd.Timestamp(end).to_pydatetime()},
+        )
+        grouped["fecha"] = pd.to_datetime(grouped["fecha"])
+        return _split_measures(grouped.set_index(["fecha", "sede"]), start, end, measures)
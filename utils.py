@@ -1,7 +1,11 @@
 
 import pandas as pd
 import numpy as np
+import re, json, hashlib
 import unicodedata
+from bisect import bisect_left
+
+from instrumentation import instrumented
 
 # ======= Mapeos de sedes =======
 SEDE_MAP = {
@@ -31,6 +35,32 @@ PREFERRED_ORDER = {
     "bogota": ["La 80", "Chia"],
 }
 
+REQUIRED_COLUMNS = ["empresa","fecha_dcto","id_co","id_item","descripcion","linea",
+                    "und_dia","venta_sin_impuesto_dia","und_acum","venta_sin_impuesto_acum"]
+
+# Dtypes explícitos para la lectura por bloques (las medidas se coercionan después)
+CSV_DTYPES = {"empresa": str, "fecha_dcto": str, "id_co": str, "id_item": str,
+              "descripcion": str, "linea": str}
+
+# Agregado diario compacto
+DAILY_KEYS = ["empresa_norm", "id_co_norm", "sede", "id_item", "fecha"]
+DAILY_MEASURES = ["und_dia", "venta_sin_impuesto_dia"]
+# Etiqueta de cada medida (selector de la app, títulos y ejes)
+MEASURE_LABELS = {"und_dia": "Unidades", "venta_sin_impuesto_dia": "Venta sin impuesto"}
+
+# Clave de deduplicación al unir varios archivos
+MERGE_KEYS = ["empresa_norm", "id_co_norm", "id_item", "fecha"]
+
+# Versión de la preparación (prepare_dataframe y carga por bloques): súbala al cambiar la
+# normalización o el esquema resultante. Junto con SEDE_MAP forma la firma que entra en la
+# clave de la caché en disco, así un cambio no reutiliza archivos preparados con la versión anterior.
+PREP_VERSION = 2
+PREP_SIGNATURE = f"p{PREP_VERSION}-" + hashlib.sha256(
+    json.dumps([SEDE_MAP, CSV_DTYPES, DAILY_KEYS, DAILY_MEASURES], sort_keys=True, default=str).encode()
+).hexdigest()[:8]
+# Columnas que trae todo DataFrame preparado (filas completas o agregado diario)
+PREPARED_COLUMNS = DAILY_KEYS + ["descripcion"] + DAILY_MEASURES
+
 DOW_ABBR_ES = {0: "lun", 1: "mar", 2: "mié", 3: "jue", 4: "vie", 5: "sáb", 6: "dom"}
 
 def _strip_accents(s: str) -> str:
@@ -43,6 +73,20 @@ def normalize_empresa(x: str) -> str:
         return "mtodo"
     return s
 
+# Nombre de cada empresa en la app (selector) y en los archivos de grupos
+EMPRESA_LABELS = {
+    "mercamio": "MERCAMIO",
+    "mtodo": "MERCATODO",
+    "bogota": "BOGOTÁ",
+}
+
+def empresa_key(x: str) -> str:
+    """Clave de empresa escrita como en el ERP ("Bogotá", "MTODO") o como en la app ("MERCATODO")."""
+    s = normalize_empresa(x)
+    return _LABEL_TO_EMPRESA.get(s, s)
+
+_LABEL_TO_EMPRESA = {normalize_empresa(v): k for k, v in EMPRESA_LABELS.items()}
+
 def normalize_id_co(x) -> str:
     try:
         xi = int(str(x).strip())
@@ -61,73 +105,608 @@ def map_sede(empresa: str, id_co: str) -> str:
     mapping = SEDE_MAP.get(emp, {})
     return mapping.get(idn, idn)
 
+def _factorize_apply(values: pd.Series, func):
+    # Aplica func una sola vez por valor distinto (incluye NaN, igual que .apply)
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    mapped = np.array([func(u) for u in uniques], dtype=object)
+    norm_codes, norm_uniques = pd.factorize(mapped)
+    return norm_codes[codes], norm_uniques
+
+@instrumented
+def normalize_keys(empresa: pd.Series, id_co: pd.Series) -> pd.DataFrame:
+    """Normaliza empresa/id_co y resuelve la sede por valores distintos (vectorizado).
+
+    Equivale a aplicar normalize_empresa, normalize_id_co y map_sede fila a fila,
+    pero cada valor distinto se resuelve una sola vez contra SEDE_MAP y el
+    resultado se difunde a todas las filas como columnas categóricas.
+    """
+    emp_codes, emp_uniques = _factorize_apply(empresa, normalize_empresa)
+    idc_codes, idc_uniques = _factorize_apply(id_co, normalize_id_co)
+
+    # Pares (empresa_norm, id_co_norm) distintos -> sede
+    n_idc = max(len(idc_uniques), 1)
+    pair_codes, pair_uniques = pd.factorize(emp_codes.astype(np.int64) * n_idc + idc_codes)
+    sedes = np.array(
+        [SEDE_MAP.get(emp_uniques[p // n_idc], {}).get(idc_uniques[p % n_idc], idc_uniques[p % n_idc])
+         for p in pair_uniques],
+        dtype=object,
+    )
+    sede_codes, sede_uniques = pd.factorize(sedes)
+
+    return pd.DataFrame({
+        "empresa_norm": pd.Categorical.from_codes(emp_codes, categories=emp_uniques),
+        "id_co_norm": pd.Categorical.from_codes(idc_codes, categories=idc_uniques),
+        "sede": pd.Categorical.from_codes(sede_codes[pair_codes], categories=sede_uniques),
+    }, index=empresa.index)
+
+# Tipo que produce to_datetime con formato (datetime64[us] en pandas 3, [ns] en pandas 2)
+_FECHA_DTYPE = pd.to_datetime(pd.Series(["20240101"]), format="%Y%m%d").dtype
+# Años que se decodifican aritméticamente (caben en datetime64[ns]); el resto va por texto
+_FECHA_MIN, _FECHA_MAX = 16780101, 22611231
+
+def _parse_fecha_text(values: pd.Series) -> np.ndarray:
+    # Ruta original: texto sin ".0" final ni guiones, formato YYYYMMDD
+    s = values.astype(str).str.replace(r"\.0$", "", regex=True).str.replace("-", "", regex=False)
+    return pd.to_datetime(s, format="%Y%m%d", errors="coerce").to_numpy(dtype=_FECHA_DTYPE)
+
+def _decode_yyyymmdd(v: np.ndarray) -> np.ndarray:
+    # Enteros YYYYMMDD -> datetime64[D] con aritmética; mes/día inválidos -> NaT
+    y, md = np.divmod(v, 10000)
+    m, d = np.divmod(md, 100)
+    ok = (m >= 1) & (m <= 12) & (d >= 1) & (d <= 31)
+    months = ((y - 1970) * 12 + np.clip(m, 1, 12) - 1).astype("datetime64[M]")
+    days = months.astype("datetime64[D]") + (np.clip(d, 1, 31) - 1)
+    ok &= days.astype("datetime64[M]") == months  # p. ej. 20240231
+    return np.where(ok, days, np.datetime64("NaT", "D"))
+
+@instrumented
 def parse_fecha(fecha_series: pd.Series) -> pd.Series:
-    s = fecha_series.astype(str).str.replace(r"\.0$", "", regex=True).str.replace("-", "", regex=False)
-    return pd.to_datetime(s, format="%Y%m%d", errors="coerce")
-
-def prepare_dataframe(df_raw: pd.DataFrame) -> pd.DataFrame:
-    df = df_raw.copy()
-    required = ["empresa","fecha_dcto","id_co","id_item","descripcion","linea",
-                "und_dia","venta_sin_impuesto_dia","und_acum","venta_sin_impuesto_acum"]
-    missing = [c for c in required if c not in df.columns]
+    """fecha_dcto -> datetime; lo que no se puede interpretar queda NaT.
+
+    Se trabaja sobre los valores distintos (pocos cientos aunque haya millones de
+    filas): los numéricos YYYYMMDD se decodifican con aritmética entera y el resto
+    ("2024-05-01", "20240501.0", ...) por la ruta de texto. El número de filas
+    que quedaron NaT va en attrs["invalidas"].
+    """
+    codes, uniques = pd.factorize(fecha_series)
+    uniq = pd.Series(uniques)
+    parsed = np.full(len(uniq) + 1, np.datetime64("NaT"), dtype=_FECHA_DTYPE)  # último = nulos (código -1)
+
+    rest = np.ones(len(uniq), dtype=bool)
+    if len(uniq) and pd.api.types.is_numeric_dtype(uniq.dtype) and not pd.api.types.is_bool_dtype(uniq.dtype):
+        vals = uniq.to_numpy(dtype=np.float64)
+        arith = (vals == np.floor(vals)) & (vals >= _FECHA_MIN) & (vals <= _FECHA_MAX)
+        parsed[:-1][arith] = _decode_yyyymmdd(vals[arith].astype(np.int64))
+        rest = ~arith
+    if rest.any():
+        parsed[:-1][rest] = _parse_fecha_text(uniq[rest])
+
+    out = pd.Series(parsed[codes], index=fecha_series.index, name=fecha_series.name)
+    out.attrs["invalidas"] = int(np.isnat(parsed)[codes].sum())
+    return out
+
+def _categorize(values: pd.Series, func) -> pd.Categorical:
+    # func(valor) una vez por valor distinto, resultado como categórica
+    codes, uniques = _factorize_apply(values, func)
+    return pd.Categorical.from_codes(codes, categories=uniques)
+
+def _strip_str(x) -> str:
+    return str(x).strip()
+
+def downcast_numeric(s: pd.Series) -> pd.Series:
+    """Entero más pequeño posible si todos los valores son enteros; si no, float64 (sin perder precisión)."""
+    vals = s.to_numpy(dtype=np.float64)
+    if len(vals) and np.isfinite(vals).all() and (vals == np.round(vals)).all():
+        return pd.to_numeric(s.astype(np.int64), downcast="integer")
+    return s.astype(np.float64)
+
+@instrumented
+def prepare_dataframe(df_raw: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """Valida y normaliza el CSV crudo.
+
+    Texto repetido como categóricas (empresa_norm, id_co_norm, sede, id_item,
+    descripcion, linea) y medidas reducidas con downcast_numeric. Con
+    copy=False se modifica df_raw en su lugar (para frames recién leídos).
+    """
+    df = df_raw.copy() if copy else df_raw
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
     if missing:
         raise ValueError(f"Faltan columnas en el CSV: {missing}")
-    df["empresa_norm"] = df["empresa"].apply(normalize_empresa)
-    df["id_co_norm"] = df["id_co"].apply(normalize_id_co)
-    df["sede"] = [map_sede(e, i) for e, i in zip(df["empresa"], df["id_co"])]
-    df["fecha"] = parse_fecha(df["fecha_dcto"])
+    keys = normalize_keys(df["empresa"], df["id_co"])
+    for c in ["empresa_norm", "id_co_norm", "sede"]:
+        df[c] = keys[c]
+    fecha = parse_fecha(df["fecha_dcto"])
+    df["fecha"] = fecha
+    df.attrs["fechas_invalidas"] = fecha.attrs["invalidas"]
     for c in ["und_dia","und_acum","venta_sin_impuesto_dia","venta_sin_impuesto_acum"]:
-        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.0)
-    df["descripcion"] = df["descripcion"].astype(str).str.strip()
+        df[c] = downcast_numeric(pd.to_numeric(df[c], errors="coerce").fillna(0.0))
+    df["id_item"] = _categorize(df["id_item"], str)
+    df["descripcion"] = _categorize(df["descripcion"], _strip_str)
+    df["linea"] = df["linea"].astype("category")
     return df
 
+def memory_report(df: pd.DataFrame, before: pd.DataFrame = None) -> pd.DataFrame:
+    """Bytes por columna (deep) de df y, si se da, de before; con fila TOTAL."""
+    rep = pd.DataFrame({"bytes": df.memory_usage(deep=True, index=False)})
+    if before is not None:
+        rep.insert(0, "bytes_antes", before.memory_usage(deep=True, index=False))
+    rep.loc["TOTAL"] = rep.sum()
+    if before is not None:
+        rep["ahorro_%"] = (1 - rep["bytes"] / rep["bytes_antes"]).mul(100).round(1)
+    return rep
+
+@instrumented
+def aggregate_daily(df: pd.DataFrame) -> pd.DataFrame:
+    """Reduce un DataFrame preparado a sumas diarias por DAILY_KEYS (descripcion/linea: primera vista)."""
+    g = df.groupby(DAILY_KEYS, observed=True, sort=False, dropna=False)
+    out = g[DAILY_MEASURES].sum()
+    out[["descripcion", "linea"]] = g[["descripcion", "linea"]].first()
+    return out.reset_index()
+
+@instrumented
+def prepare_csv_streaming(source, chunksize: int = 500_000) -> pd.DataFrame:
+    """Lee el CSV por bloques y devuelve directamente el agregado diario.
+
+    Cada bloque se prepara con prepare_dataframe y se reduce con aggregate_daily
+    antes de leer el siguiente, así la memoria pico queda acotada por el tamaño
+    del bloque más el agregado, no por el tamaño del archivo.
+    """
+    agg = None
+    invalidas = 0
+    reader = pd.read_csv(source, dtype=CSV_DTYPES, chunksize=chunksize)
+    for chunk in reader:
+        prepared = prepare_dataframe(chunk, copy=False)
+        invalidas += prepared.attrs["fechas_invalidas"]
+        part = aggregate_daily(prepared)
+        if agg is None:
+            agg = part
+        else:
+            merged = pd.concat([agg, part], ignore_index=True)
+            agg = aggregate_daily(merged)
+    for c in ["empresa_norm", "id_co_norm", "sede", "id_item", "descripcion", "linea"]:
+        agg[c] = agg[c].astype("category")
+    for c in DAILY_MEASURES:
+        agg[c] = downcast_numeric(agg[c])
+    agg.attrs = {"fechas_invalidas": invalidas}
+    return agg
+
+@instrumented
+def merge_prepared(frames, dedup: bool = True) -> pd.DataFrame:
+    """Une DataFrames preparados en orden de carga, deduplicando por MERGE_KEYS.
+
+    Si una clave aparece en varios archivos se conservan solo las filas del
+    último que la trae (una re-exportación reemplaza a la anterior); las filas
+    repetidas dentro de un mismo archivo no se tocan. Con dedup=False solo se
+    concatenan (partes que no se solapan).
+    """
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        raise ValueError("No hay archivos para unir")
+    if len(frames) == 1:
+        return frames[0]
+
+    # Categorías unidas para que concat no convierta las categóricas en texto
+    frames = [f.copy(deep=False) for f in frames]
+    for c in frames[0].columns:
+        if all(isinstance(f[c].dtype, pd.CategoricalDtype) for f in frames if c in f):
+            cats = pd.api.types.union_categoricals([f[c] for f in frames if c in f]).categories
+            for f in frames:
+                if c in f:
+                    f[c] = f[c].cat.set_categories(cats)
+
+    src = np.repeat(np.arange(len(frames)), [len(f) for f in frames])
+    df = pd.concat(frames, ignore_index=True)
+    if not dedup:
+        df.attrs = {"fechas_invalidas": sum(f.attrs.get("fechas_invalidas", 0) for f in frames)}
+        return df
+    last = pd.Series(src).groupby([df[k] for k in MERGE_KEYS], observed=True, dropna=False).transform("max")
+    out = df[src == last.to_numpy()].reset_index(drop=True)
+    out.attrs = {"fechas_invalidas": sum(f.attrs.get("fechas_invalidas", 0) for f in frames)}
+    return out
+
 def items_display_list(df: pd.DataFrame):
     ix = (df["id_item"].astype(str) + " - " + df["descripcion"].astype(str)).dropna().unique().tolist()
     ix.sort()
     return ix
 
-def _fmt_number(x):
-    if pd.isna(x):
-        return "-"
-    if abs(x - int(x)) < 1e-9:
-        if int(x) == 0:
-            return "-"
-        return int(x)
-    return round(x, 1)
+# ======= Catálogo de ítems (una vez por dataset) =======
+def normalize_text(s: str) -> str:
+    return _strip_accents(str(s).lower()).strip()
 
-def build_numeric_pivot_range(df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
-    all_days = pd.date_range(start=start, end=end, freq="D")
-    pt = pd.pivot_table(df, index="fecha", columns="sede", values="und_dia", aggfunc="sum", fill_value=0.0)
-    pt = pt.reindex(all_days, fill_value=0.0).sort_index()
+@instrumented
+def build_item_catalog(df: pd.DataFrame) -> dict:
+    """Ítems distintos con descripción normalizada, índice de tokens y rango de fechas por empresa.
+
+    - items: id_item, descripcion, label ("id - descripcion"), desc_norm; ordenado por label
+    - spans: pos (fila en items), empresa_norm, min/max de fecha
+    - tokens/token_pos: tokens de desc_norm ordenados y su posición en items (búsqueda por prefijo)
+    """
+    base = pd.DataFrame({
+        "id_item": df["id_item"].astype(str),
+        "descripcion": df["descripcion"].astype(str),
+        "empresa_norm": df["empresa_norm"],
+        "fecha": df["fecha"],
+    })
+    spans = (base.groupby(["id_item", "descripcion", "empresa_norm"], observed=True, sort=False)["fecha"]
+             .agg(["min", "max"]).reset_index())
+    spans["label"] = spans["id_item"] + " - " + spans["descripcion"]
+
+    items = spans.drop_duplicates("label")[["id_item", "descripcion", "label"]]
+    items = items.iloc[np.argsort(items["label"].to_numpy(dtype=object), kind="stable")].reset_index(drop=True)
+    items["desc_norm"] = [normalize_text(d) for d in items["descripcion"]]
+    spans["pos"] = pd.Index(items["label"]).get_indexer(spans["label"])
+
+    pairs = sorted((tok, i) for i, d in enumerate(items["desc_norm"]) for tok in set(d.split()))
+    return {
+        "items": items,
+        "spans": spans[["pos", "empresa_norm", "min", "max"]],
+        "tokens": [t for t, _ in pairs],
+        "token_pos": np.array([i for _, i in pairs], dtype=np.int64),
+    }
+
+def catalog_date_bounds(catalog: dict, empresas):
+    sp = catalog["spans"]
+    sp = sp[sp["empresa_norm"].isin(list(empresas))]
+    if sp.empty or sp["min"].isna().all():
+        return None
+    return sp["min"].min(), sp["max"].max()
+
+@instrumented
+def item_options(catalog: dict, empresas, start: pd.Timestamp, end: pd.Timestamp) -> list:
+    """Etiquetas "id - descripcion" con ventas de esas empresas dentro del rango (o de todo el archivo si no hay)."""
+    sp = catalog["spans"]
+    m_emp = sp["empresa_norm"].isin(list(empresas))
+    m_rng = m_emp & (sp["min"] <= end) & (sp["max"] >= start)
+    pos = np.unique(sp.loc[m_rng if m_rng.any() else m_emp, "pos"].to_numpy())
+    return catalog["items"]["label"].to_numpy(dtype=object)[pos].tolist()
+
+def search_items(catalog: dict, needle: str) -> list:
+    """id_item cuyos tokens de descripción empiezan por cada palabra de needle (sin tildes ni mayúsculas)."""
+    words = normalize_text(needle).split()
+    if not words:
+        return []
+    tokens, token_pos = catalog["tokens"], catalog["token_pos"]
+    hits = None
+    for w in words:
+        lo, hi = bisect_left(tokens, w), bisect_left(tokens, w + "\uffff")
+        found = set(token_pos[lo:hi].tolist())
+        hits = found if hits is None else hits & found
+        if not hits:
+            return []
+    return sorted(set(catalog["items"]["id_item"].to_numpy(dtype=object)[sorted(hits)].tolist()))
+
+def _order_sede_columns(pt: pd.DataFrame) -> pd.DataFrame:
+    # Orden preferido de sedes + columna "T. Dia"
+    pt = pt.astype(np.float64)
     preferred_all = []
     for emp in ["mercamio","mtodo","bogota"]:
         preferred_all += [c for c in PREFERRED_ORDER.get(emp, []) if c in pt.columns]
-    preferred_all += [c for c in pt.columns if c not in preferred_all]
+    preferred_all += sorted((c for c in pt.columns if c not in preferred_all), key=str)
     pt = pt.reindex(columns=preferred_all)
     pt["T. Dia"] = pt.sum(axis=1)
     return pt
 
-def build_daily_table_all_range(df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp, footer_label="Acum. Rango:") -> pd.DataFrame:
+def _split_measures(grouped: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp, measures) -> dict:
+    # grouped: sumas por (fecha, sede) con una columna por medida -> {medida: pivot fecha × sede}
     all_days = pd.date_range(start=start, end=end, freq="D")
-    if df.empty:
-        base = pd.DataFrame(index=all_days)
-        base["T. Dia"] = 0.0
-        fechas_fmt = [f"{i.day}/{DOW_ABBR_ES.get(i.dayofweek, '')}" for i in base.index]
-        base.insert(0, "Fecha", fechas_fmt)
-        final = pd.concat([base.reset_index(drop=True),
-                           pd.DataFrame([[footer_label, 0.0]], columns=["Fecha","T. Dia"])],
-                          ignore_index=True)
-        final["T. Dia"] = final["T. Dia"].astype(float).map(_fmt_number)
-        return final
-
-    pt = build_numeric_pivot_range(df, start, end)
-    fechas_fmt = [f"{i.day}/{DOW_ABBR_ES.get(i.dayofweek, '')}" for i in pt.index]
-    pt.insert(0, "Fecha", fechas_fmt)
-    acum = pt.drop(columns=["Fecha"]).sum(axis=0)
-    final = pd.concat([pt.reset_index(drop=True),
-                       pd.DataFrame([[footer_label] + list(acum.values)],
-                                    columns=["Fecha"] + list(acum.index))],
-                      ignore_index=True)
-    for c in [c for c in final.columns if c != "Fecha"]:
-        final[c] = final[c].astype(float).map(_fmt_number)
+    wide = grouped.unstack("sede", fill_value=0.0)
+    out = {}
+    for m in measures:
+        pt = wide[m] if m in wide.columns.get_level_values(0) else pd.DataFrame(index=wide.index)
+        pt.columns = pt.columns.astype(object)
+        pt = pt.reindex(all_days, fill_value=0.0).sort_index()
+        pt.columns.name = "sede"
+        out[m] = _order_sede_columns(pt)
+    return out
+
+@instrumented
+def pivot_measures_range(df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp, measures=DAILY_MEASURES) -> dict:
+    """Pivots fecha × sede (+ "T. Dia") de todas las medidas con un solo groupby: {medida: pivot}."""
+    measures = list(measures)
+    grouped = df.groupby(["fecha", "sede"], observed=True)[measures].sum()
+    return _split_measures(grouped, start, end, measures)
+
+@instrumented
+def build_numeric_pivot_range(df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp, value: str = "und_dia") -> pd.DataFrame:
+    return pivot_measures_range(df, start, end, [value])[value]
+
+def resolve_item_ids(catalog: dict, selection) -> set:
+    """id_item (str) de una selección: opciones "id - descripcion", ids sueltos o textos a buscar."""
+    ids = set()
+    for it in selection:
+        s = str(it)
+        if " - " in s:
+            ids.add(s.split(" - ", 1)[0].strip())
+        elif s.isdigit() or s.strip().isdigit():
+            ids.add(s.strip())
+        else:
+            # Descripciones: búsqueda en el índice de tokens del catálogo (sin recorrer filas)
+            ids.update(search_items(catalog, s.strip()))
+    return ids
+
+def first_word_from_option(opt: str) -> str:
+    # Si viene "123 - Descripción del producto", tomar solo la descripción
+    desc = opt.split(" - ", 1)[1] if " - " in opt else opt
+    desc = desc.strip()
+
+    # Limpieza básica: quita caracteres especiales al final (.,;:! etc)
+    desc = re.sub(r"[^\wÁÉÍÓÚáéíóúÑñ/ ]+", "", desc)
+
+    if not desc:
+        return ""
+
+    # Divide en palabras separadas por espacio, conservando expresiones como "C/RES"
+    palabras = desc.split()
+
+    # Toma hasta 2 palabras
+    primeras = palabras[:2]
+    return " ".join(primeras)
+
+def table_title(options, measure: str = "und_dia") -> str:
+    """Título de la tabla según los ítems (primeras palabras, en el orden dado) y la medida."""
+    unit = f"({MEASURE_LABELS[measure].lower()})"
+    if options:
+        first_words = [first_word_from_option(s) for s in options]
+        return "Tabla diaria consolidada — " + " · ".join(first_words) + " " + unit
+    return "Tabla diaria consolidada " + unit
+
+# ======= Cubo diario ítem × empresa × sede × fecha =======
+CUBE_LEVELS = ["id_item", "empresa_norm", "sede", "fecha"]
+
+@instrumented
+def build_daily_cube(df: pd.DataFrame) -> pd.DataFrame:
+    """Sumas diarias de DAILY_MEASURES indexadas por CUBE_LEVELS (MultiIndex ordenado).
+
+    Se construye una vez por dataset; seleccionar ítems y rango es luego un
+    corte del índice sobre pocas filas, sin recorrer las filas originales.
+    """
+    ok = df["fecha"].notna()
+    cube = df[CUBE_LEVELS + DAILY_MEASURES][ok].groupby(CUBE_LEVELS, observed=True)[DAILY_MEASURES].sum()
+    return cube.sort_index()
+
+@instrumented
+def cube_pivot_measures(cube: pd.DataFrame, items, empresas, start: pd.Timestamp, end: pd.Timestamp,
+                        measures=DAILY_MEASURES) -> dict:
+    """pivot_measures_range sobre las filas de esos ítems/empresas, leyendo del cubo: un corte y un groupby para todas las medidas."""
+    measures = list(measures)
+    present = cube.index.levels[0]
+    items = [str(i) for i in items if str(i) in present]
+    part = cube.loc[items, measures] if items else cube[measures].iloc[:0]
+    fechas = part.index.get_level_values("fecha")
+    keep = part.index.get_level_values("empresa_norm").isin(list(empresas)) & (fechas >= start) & (fechas <= end)
+    grouped = part[keep].groupby(level=["fecha", "sede"], observed=True).sum()
+    return _split_measures(grouped, start, end, measures)
+
+def cube_pivot_range(cube: pd.DataFrame, items, empresas, start: pd.Timestamp, end: pd.Timestamp,
+                     value: str = "und_dia") -> pd.DataFrame:
+    """Equivalente a build_numeric_pivot_range sobre las filas de esos ítems/empresas, leyendo del cubo."""
+    return cube_pivot_measures(cube, items, empresas, start, end, [value])[value]
+
+# ======= Comparación entre periodos (sumas acumuladas por ítem × empresa × sede) =======
+COMPARISON_MODES = {"prev": "Periodo anterior", "year": "Mismo rango año anterior"}
+
+@instrumented
+def build_cumulative(cube: pd.DataFrame) -> dict:
+    """Sumas acumuladas por día de cada grupo (ítem, empresa, sede) del cubo, una vez por dataset.
+
+    El total de cualquier ventana de un grupo es la diferencia de dos acumulados,
+    que se ubican con una búsqueda binaria sobre la clave (grupo, día).
+    """
+    idx = cube.index
+    n = len(idx)
+    first = np.ones(n, dtype=bool)
+    for lvl in range(3):
+        c = idx.codes[lvl]
+        first[1:] &= c[1:] == c[:-1]
+    new_group = ~first
+    new_group[:1] = True
+    gid = np.cumsum(new_group) - 1
+    gstart = np.flatnonzero(new_group)
+
+    fechas = idx.get_level_values("fecha")
+    day0 = fechas.min() if n else pd.Timestamp("1970-01-01")
+    days = ((fechas - day0) // pd.Timedelta(days=1)).to_numpy(dtype=np.int64) if n else np.zeros(0, np.int64)
+    span = int(days.max()) + 2 if n else 2
+
+    cum = cube[DAILY_MEASURES].groupby(gid).cumsum().to_numpy(dtype=np.float64)
+    groups = pd.DataFrame({lvl: idx.get_level_values(lvl)[gstart].astype(str) for lvl in CUBE_LEVELS[:3]})
+    return {"keys": gid.astype(np.int64) * span + days, "cum": cum, "gstart": gstart, "groups": groups,
+            "day0": day0, "span": span}
+
+def _cum_groups(cumidx: dict, items, empresas) -> np.ndarray:
+    g = cumidx["groups"]
+    keep = g["id_item"].isin([str(i) for i in items]) & g["empresa_norm"].isin([str(e) for e in empresas])
+    return np.flatnonzero(keep.to_numpy())
+
+def _cum_at(cumidx: dict, gids: np.ndarray, dates) -> np.ndarray:
+    # Acumulado de cada grupo hasta cada fecha (incluida): (grupos, fechas, medidas)
+    days = ((pd.DatetimeIndex(dates) - cumidx["day0"]) // pd.Timedelta(days=1)).to_numpy(dtype=np.int64)
+    span = cumidx["span"]
+    d = np.clip(days, -1, span - 2)
+    pos = np.searchsorted(cumidx["keys"], gids[:, None] * span + d[None, :], side="right") - 1
+    valid = (pos >= cumidx["gstart"][gids][:, None]) & (d >= 0)[None, :]
+    vals = cumidx["cum"][np.maximum(pos, 0)]
+    return np.where(valid[..., None], vals, 0.0)
+
+def _by_sede(cumidx: dict, gids: np.ndarray, values: np.ndarray) -> pd.DataFrame:
+    sedes = cumidx["groups"]["sede"].to_numpy()[gids]
+    return pd.DataFrame(values, columns=DAILY_MEASURES).groupby(sedes).sum()
+
+def comparison_range(start: pd.Timestamp, end: pd.Timestamp, mode: str) -> pd.DatetimeIndex:
+    """Día equivalente en el periodo de comparación para cada día de [start, end].
+
+    En "year" el 29 de febrero no tiene equivalente (NaT): restar un año lo llevaría al 28,
+    que ya es el equivalente del 28 y se contaría dos veces.
+    """
+    days = pd.date_range(start=start, end=end, freq="D")
+    if mode == "year":
+        return (days - pd.DateOffset(years=1)).where(~((days.month == 2) & (days.day == 29)))
+    return days - pd.Timedelta(days=len(days))
+
+@instrumented
+def cum_window_totals(cumidx: dict, items, empresas, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    """Totales de la ventana [start, end] por sede (filas) y medida (columnas): dos acumulados por grupo."""
+    gids = _cum_groups(cumidx, items, empresas)
+    at = _cum_at(cumidx, gids, [start - pd.Timedelta(days=1), end])
+    return _by_sede(cumidx, gids, at[:, 1] - at[:, 0])
+
+@instrumented
+def cum_daily_totals(cumidx: dict, items, empresas, dates) -> pd.DataFrame:
+    """Total de todas las sedes en cada una de esas fechas (filas) por medida, sin recorrer filas.
+
+    Las fechas NaT (días sin equivalente) dan 0.
+    """
+    dates = pd.DatetimeIndex(dates)
+    missing = dates.isna()
+    known = dates.where(~missing, cumidx["day0"])
+    gids = _cum_groups(cumidx, items, empresas)
+    at = _cum_at(cumidx, gids, known.append(known - pd.Timedelta(days=1)))
+    daily = (at[:, :len(dates)] - at[:, len(dates):]).sum(axis=0)
+    daily[missing] = 0.0
+    return pd.DataFrame(daily.reshape(len(dates), -1), index=dates, columns=DAILY_MEASURES)
+
+def _variation(cur, prev):
+    cur, prev = np.asarray(cur, dtype=np.float64), np.asarray(prev, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(prev != 0, (cur - prev) / prev * 100.0, np.nan)
+
+def add_comparison(tabla: pd.DataFrame, comp_daily, comp_totals: pd.Series, label: str) -> pd.DataFrame:
+    """Agrega a la tabla diaria "T. Dia comp." y "Var. %" por día y dos filas finales:
+    acumulado del periodo de comparación por sede y variación % por sede.
+
+    comp_daily: total del día equivalente (una por día de la tabla); comp_totals: total por sede.
+    """
+    footer = tabla.iloc[-1]
+    sedes_cur = [c for c in tabla.columns if c not in ("Fecha", "T. Dia")]
+    extra = [s for s in comp_totals.index if s not in sedes_cur and comp_totals[s] != 0]
+    sedes = list(_order_sede_columns(pd.DataFrame(columns=sedes_cur + extra)).columns.drop("T. Dia"))
+
+    out = tabla.reindex(columns=["Fecha"] + sedes + ["T. Dia"], fill_value=0.0)
+    # Total del pie desde comp_totals: la ventana completa, igual que la fila "Acum."
+    comp_total = float(comp_totals.sum())
+    comp_col = np.append(np.asarray(comp_daily, dtype=np.float64), comp_total)
+    out["T. Dia comp."] = comp_col
+    out["Var. %"] = _variation(out["T. Dia"], comp_col)
+
+    comp_sedes = comp_totals.reindex(sedes, fill_value=0.0).to_numpy(dtype=np.float64)
+    cur_sedes = out.iloc[-1][sedes].to_numpy(dtype=np.float64)
+    rows = pd.DataFrame([
+        [f"Acum. {label}:"] + list(comp_sedes) + [comp_total, np.nan, np.nan],
+        ["Var. %:"] + list(_variation(cur_sedes, comp_sedes)) + [float(_variation(footer["T. Dia"], comp_total)), np.nan, np.nan],
+    ], columns=out.columns)
+    out = pd.concat([out, rows], ignore_index=True)
+    out.attrs = {"footer_rows": 3}
+    return out
+
+# ======= Ranking de ítems (top-N desde los acumulados) =======
+RANKING_ALL = "Todas"
+
+def _top_positions(values: np.ndarray, n: int) -> np.ndarray:
+    # Posiciones de los n mayores (> 0) de mayor a menor: selección parcial y orden de solo esos n
+    n = min(n, len(values))
+    if n <= 0:
+        return np.zeros(0, dtype=np.int64)
+    idx = np.argpartition(-values, n - 1)[:n]
+    idx = idx[np.lexsort((idx, -values[idx]))]
+    return idx[values[idx] > 0]
+
+@instrumented
+def top_items(cumidx: dict, empresas, start: pd.Timestamp, end: pd.Timestamp, measure: str = "und_dia",
+              n: int = 10) -> pd.DataFrame:
+    """Top-n de ítems por measure en [start, end] para esas empresas, en total (sede RANKING_ALL) y por sede.
+
+    Columnas: sede, puesto, id_item, valor. El total de la ventana por (ítem, empresa, sede)
+    sale de build_cumulative; después solo hay sumas por código (bincount) y argpartition.
+    """
+    g = cumidx["groups"]
+    gids = np.flatnonzero(g["empresa_norm"].isin([str(e) for e in empresas]).to_numpy())
+    at = _cum_at(cumidx, gids, [start - pd.Timedelta(days=1), end])
+    window = at[:, 1, DAILY_MEASURES.index(measure)] - at[:, 0, DAILY_MEASURES.index(measure)]
+
+    item_codes, item_ids = pd.factorize(g["id_item"].to_numpy()[gids])
+    sede_codes, sedes = pd.factorize(g["sede"].to_numpy()[gids])
+    n_items = len(item_ids)
+    per_sede = np.bincount(sede_codes * n_items + item_codes, weights=window,
+                           minlength=len(sedes) * n_items).reshape(len(sedes), n_items)
+
+    ordered = list(_order_sede_columns(pd.DataFrame(columns=list(sedes))).columns.drop("T. Dia"))
+    rows = [(RANKING_ALL, per_sede.sum(axis=0))]
+    rows += [(s, per_sede[pd.Index(sedes).get_loc(s)]) for s in ordered]
+    parts = []
+    for sede, totals in rows:
+        top = _top_positions(totals, n)
+        parts.append(pd.DataFrame({"sede": sede, "puesto": np.arange(1, len(top) + 1),
+                                   "id_item": np.asarray(item_ids, dtype=object)[top], "valor": totals[top]}))
+    return pd.concat(parts, ignore_index=True)
+
+# ======= Resolución temporal de las gráficas =======
+CHART_RESOLUTIONS = {"D": "Diaria", "W": "Semanal", "M": "Mensual"}
+_RESAMPLE_RULES = {"W": "W-MON", "M": "MS"}
+
+def choose_resolution(n_days: int, weekly_after: int = 92, monthly_after: int = 730) -> str:
+    """"D", "W" o "M" según la longitud del rango (en días)."""
+    if n_days > monthly_after:
+        return "M"
+    if n_days > weekly_after:
+        return "W"
+    return "D"
+
+@instrumented
+def rollup_pivot(pt: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Suma el pivot diario por semana (inicio lunes) o por mes (inicio de mes); "D" lo deja igual."""
+    if freq == "D":
+        return pt
+    return pt.resample(_RESAMPLE_RULES[freq], label="left", closed="left").sum()
+
+def build_daily_table_all_range(df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp, footer_label="Acum. Rango:") -> pd.DataFrame:
+    return build_daily_table_from_pivot(build_numeric_pivot_range(df, start, end), footer_label)
+
+_DOW_NAMES = np.array([DOW_ABBR_ES[i] for i in range(7)], dtype=object)
+
+@instrumented
+def build_daily_table_from_pivot(pt: pd.DataFrame, footer_label="Acum. Rango:") -> pd.DataFrame:
+    """Tabla diaria: "Fecha" ("1/lun") + columnas numéricas (float64) y fila final de acumulado.
+
+    Los números quedan sin formatear; para mostrar/exportar ver format_table_values
+    y format_table_display.
+    """
+    idx = pd.DatetimeIndex(pt.index)
+    fechas = (idx.day.astype(str).to_numpy(dtype=object) + "/" + _DOW_NAMES[idx.dayofweek]).tolist()
+    values = pt.to_numpy(dtype=np.float64)
+    body = np.vstack([values, values.sum(axis=0, keepdims=True)])
+    final = pd.DataFrame(body, columns=list(pt.columns))
+    final.insert(0, "Fecha", fechas + [footer_label])
     return final
+
+def _number_parts(tabla: pd.DataFrame):
+    # Columnas numéricas de la tabla y máscaras: vacío (0/NaN -> "-") y entero
+    cols = [c for c in tabla.columns if c != "Fecha"]
+    v = tabla[cols].to_numpy(dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        is_int = np.abs(v - np.trunc(v)) < 1e-9
+        empty = np.isnan(v) | (is_int & (np.trunc(v) == 0))
+    return cols, v, empty, is_int
+
+def format_table_values(tabla: pd.DataFrame) -> np.ndarray:
+    """Matriz object para el reporte: "-" en 0/NaN, enteros como int y el resto redondeado a 1 decimal."""
+    cols, v, empty, is_int = _number_parts(tabla)
+    out = np.empty((len(tabla), len(cols) + 1), dtype=object)
+    out[:, 0] = tabla["Fecha"].to_numpy(dtype=object)
+    nums = np.where(is_int, np.trunc(np.nan_to_num(v)), np.round(v, 1))
+    out[:, 1:] = nums.astype(object)
+    ints = is_int & ~empty
+    out[:, 1:][ints] = nums[ints].astype(np.int64).astype(object)
+    out[:, 1:][empty] = "-"
+    return out
+
+def format_table_display(tabla: pd.DataFrame) -> pd.DataFrame:
+    """Misma tabla como texto para pantalla ("-", enteros sin decimales, el resto con 1 decimal)."""
+    cols, v, empty, is_int = _number_parts(tabla)
+    safe = np.where(empty, 0.0, v)
+    as_int = pd.DataFrame(np.trunc(safe).astype(np.int64)).astype(str).to_numpy()
+    as_dec = pd.DataFrame(np.round(safe, 1)).astype(str).to_numpy()
+    text = np.where(empty, "-", np.where(is_int, as_int, as_dec))
+    out = pd.DataFrame(text, columns=cols, index=tabla.index)
+    out.insert(0, "Fecha", tabla["Fecha"].to_numpy())
+    out.attrs = dict(tabla.attrs)
+    return out